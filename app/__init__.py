@@ -5,6 +5,8 @@ import os
 from .services.config_manager import config_manager
 from .services.log_manager import log_manager
 from .services.scheduler import scheduler
+from .services.token_store import token_store
+from .services.config_watcher import config_watcher
 from .auth import init_auth
 
 def create_app():
@@ -59,6 +61,8 @@ def create_app():
 
     # 初始化服务管理器
     config_manager.init_app(app)
+    token_store.init_app(app)
+    token_store.migrate_from_config(config_manager)
     log_manager.init_app(app)
     scheduler.init_app(app)
     
@@ -74,4 +78,7 @@ def create_app():
     if not scheduler.running:
         scheduler.start()
 
+    # 监视配置文件的外部修改并热加载
+    config_watcher.start(app)
+
     return app 
\ No newline at end of file
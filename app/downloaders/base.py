@@ -32,4 +32,37 @@ class DownloaderBase(ABC):
         获取当前实际下载和上传速度。
         :return: dict -> {'download_speed': KB/s, 'upload_speed': KB/s} 或 None
         """
-        pass 
\ No newline at end of file
+        pass
+
+    def get_speed_limits(self):
+        """
+        读取下载器当前实际生效的速率限制，供调度器对账使用（可选实现）。
+        :return: (download_limit_kb, upload_limit_kb)，0为无限制；不支持或读取失败时返回 None
+        """
+        return None
+
+    def limits_match(self, desired_limits, actual_limits):
+        """
+        判断读回的实际限速是否与期望一致。
+        单位或精度特殊的下载器（例如按百分比限速的SABnzbd）可以覆盖。
+        """
+        return tuple(desired_limits) == tuple(actual_limits)
+
+    def sample(self, read_limits=False):
+        """
+        一次采样：当前速度，以及需要对账时的实际限速。
+        能在同一个请求中取得两者的插件可以覆盖此方法以减少请求数。
+        :return: (current_speeds, actual_limits)，未读取或读取失败的部分为 None
+        """
+        current_speeds = self.get_current_speeds()
+        actual_limits = self.get_speed_limits() if read_limits and current_speeds is not None else None
+        return current_speeds, actual_limits
+
+    def close(self):
+        """
+        释放插件持有的连接资源。
+        插件实例会被插件池长期复用，只有在配置变化或实例删除时才会被关闭。
+        """
+        session = getattr(self, 'session', None)
+        if session is not None:
+            session.close() 
\ No newline at end of file
@@ -4,6 +4,7 @@ import struct
 from typing import Dict, Any, Optional
 from .base import DownloaderBase
 from ..services.log_manager import log_manager
+from ..services.token_store import token_store
 
 class CloudDrive2(DownloaderBase):
     """CloudDrive2下载器的实现"""
@@ -13,8 +14,8 @@ class CloudDrive2(DownloaderBase):
         self.url = self.config.get('url', '').rstrip('/')
         self.username = self.config.get('username')
         self.password = self.config.get('password')
-        # 从配置中读取保存的token
-        self.token = self.config.get('saved_token')
+        # 从令牌缓存中读取保存的token
+        self.token = token_store.get(self.config.get('id'), self.url, self.username)
         self.session = requests.Session()
         
         # 设置默认headers
@@ -151,41 +152,22 @@ class CloudDrive2(DownloaderBase):
                     log_manager.log_event("CLOUDDRIVE2", "CloudDrive2 token已过期，需要重新登录")
                     # 清除过期的token
                     self.token = None
-                    self._save_token_to_config(None)
+                    self._save_token(None)
                 elif 'response' in locals() and response.status_code == 401 and service_method != 'GetToken':
                     log_manager.log_event("CLOUDDRIVE2", "CloudDrive2 token已过期，需要重新登录")
                     # 清除过期的token
                     self.token = None
-                    self._save_token_to_config(None)
+                    self._save_token(None)
             except:
                 pass
             
             log_manager.log_formatted_event("CLOUDDRIVE2_ERROR", "gRPC请求失败: {0}", str(e))
             return {}
     
-    def _save_token_to_config(self, token):
-        """保存token到配置文件"""
+    def _save_token(self, token):
+        """保存token到令牌缓存（不修改配置文件）"""
         try:
-            from ..services.config_manager import config_manager
-            
-            # 获取当前配置
-            settings = config_manager.get_settings()
-            
-            # 查找当前实例并更新token
-            instance_id = self.config.get('id')
-            if instance_id:
-                for downloader in settings.get('downloaders', []):
-                    if downloader.get('id') == instance_id:
-                        if token:
-                            downloader['saved_token'] = token
-                        else:
-                            # 清除过期的token
-                            downloader.pop('saved_token', None)
-                        break
-                
-                # 保存配置（静默保存，不记录日志）
-                config_manager.save_settings(settings)
-            
+            token_store.set(self.config.get('id'), token, self.url, self.username)
         except Exception as e:
             log_manager.log_formatted_event("CLOUDDRIVE2_ERROR", "保存CloudDrive2 token时出错: {0}", str(e))
 
@@ -207,8 +189,8 @@ class CloudDrive2(DownloaderBase):
                 new_token = response.get(3)  # token field
                 self.token = new_token
                 
-                # 保存token到配置文件
-                self._save_token_to_config(new_token)
+                # 保存token到令牌缓存
+                self._save_token(new_token)
                 
                 if old_token:
                     log_manager.log_formatted_event("CLOUDDRIVE2", f"CloudDrive2重新登录成功")
@@ -278,6 +260,26 @@ class CloudDrive2(DownloaderBase):
             log_manager.log_formatted_event("CLOUDDRIVE2_ERROR", "CloudDrive2设置速率限制时出错: {0}", str(e))
             return False
     
+    def get_speed_limits(self):
+        """读取系统设置中的最大下载/上传速度（KB/s）"""
+        if not self.token and not self.login():
+            return None
+        try:
+            settings = self._make_grpc_request('GetSystemSettings')
+            # 空响应无法区分"全部为默认值"和请求失败，按未读取处理
+            if not settings:
+                return None
+            limits = []
+            for field in (11, 12):  # maxDownloadSpeedKBytesPerSecond, maxUploadSpeedKBytesPerSecond
+                value = settings.get(field, 0.0)
+                if not isinstance(value, (int, float)):
+                    return None
+                limits.append(int(value))
+            return tuple(limits)
+        except Exception as e:
+            log_manager.log_formatted_event("CLOUDDRIVE2_ERROR", "读取CloudDrive2速率限制时出错: {0}", str(e))
+            return None
+
     def test_connection(self):
         """测试连接"""
         if not self.url or not self.username or not self.password:
@@ -11,6 +11,7 @@ class Qbittorrent(DownloaderBase):
         self.username = self.config.get('username')
         self.password = self.config.get('password')
         self.session = requests.Session()
+        self.logged_in = False  # 插件实例被长期复用，登录Cookie在多次调用之间保持有效
 
     def login(self):
         if not self.url or not self.username:
@@ -21,24 +22,47 @@ class Qbittorrent(DownloaderBase):
             data = {'username': self.username, 'password': self.password}
             response = self.session.post(login_url, data=data, timeout=10)
             if response.status_code == 200 and response.text == "Ok.":
+                self.logged_in = True
                 return True
             else:
+                self.logged_in = False
                 log_manager.log_formatted_event("QB_ERROR", "qBittorrent登录失败: {0}", response.text)
                 return False
         except requests.exceptions.RequestException as e:
+            self.logged_in = False
             log_manager.log_formatted_event("QB_ERROR", "qBittorrent连接错误: {0}", str(e))
             return False
 
+    def _ensure_login(self):
+        """仅在尚未登录时登录"""
+        return self.logged_in or self.login()
+
+    def _request(self, method, url, **kwargs):
+        """
+        发送已认证的请求。
+        如果Cookie已失效（HTTP 403），重新登录后重试一次。
+        """
+        if not self._ensure_login():
+            return None
+        kwargs.setdefault('timeout', 10)
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code == 403:
+            self.logged_in = False
+            if not self.login():
+                return None
+            response = self.session.request(method, url, **kwargs)
+        return response
+
     def set_speed_limits(self, download_limit_kb, upload_limit_kb):
-        if not self.login():
-            return False
         try:
             preferences_url = f"{self.url}/api/v2/app/setPreferences"
             data = {'json': json.dumps({
                 'dl_limit': download_limit_kb * 1024 if download_limit_kb > 0 else 0,
                 'up_limit': upload_limit_kb * 1024 if upload_limit_kb > 0 else 0
             })}
-            response = self.session.post(preferences_url, data=data)
+            response = self._request('POST', preferences_url, data=data)
+            if response is None:
+                return False
             if response.status_code == 200:
                 return True
             else:
@@ -48,6 +72,22 @@ class Qbittorrent(DownloaderBase):
             log_manager.log_formatted_event("QB_ERROR", "设置速率限制时出错: {0}", str(e))
             return False
 
+    def get_speed_limits(self):
+        """读取全局速率限制（preferences 中的 dl_limit/up_limit，单位字节/秒）"""
+        try:
+            preferences_url = f"{self.url}/api/v2/app/preferences"
+            response = self._request('GET', preferences_url)
+            if response is None:
+                return None
+            if response.status_code != 200:
+                log_manager.log_formatted_event("QB_ERROR", "读取qBittorrent速率限制失败: HTTP {0}", response.status_code)
+                return None
+            data = response.json()
+            return tuple(max(int(data.get(key) or 0), 0) // 1024 for key in ('dl_limit', 'up_limit'))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log_manager.log_formatted_event("QB_ERROR", "读取qBittorrent速率限制时出错: {0}", str(e))
+            return None
+
     def test_connection(self):
         if not self.url or not self.username:
             return False, "qBittorrent URL或用户名未配置"
@@ -59,13 +99,12 @@ class Qbittorrent(DownloaderBase):
 
     def get_current_speeds(self):
         """获取当前实际下载和上传速度"""
-        if not self.login():
-            return None
-        
         try:
             # 获取全局统计信息
             stats_url = f"{self.url}/api/v2/transfer/info"
-            response = self.session.get(stats_url, timeout=10)
+            response = self._request('GET', stats_url)
+            if response is None:
+                return None
             
             if response.status_code == 200:
                 data = response.json()
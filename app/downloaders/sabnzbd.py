@@ -3,7 +3,7 @@ import json
 import time
 import urllib.parse
 from .base import DownloaderBase
-from ..services.log_manager import log_manager
+from ..services.log_manager import log_manager, N_
 from flask_babel import gettext as _
 
 class Sabnzbd(DownloaderBase):
@@ -21,7 +21,7 @@ class Sabnzbd(DownloaderBase):
         # 如果没有配置最大带宽，设置一个默认值
         if self.max_bandwidth_kb <= 0:
             self.max_bandwidth_kb = 50 * 1024  # 默认50MB/s
-            log_manager.log_formatted_event("SABNZBD", _("SABnzbd未配置最大带宽，使用默认值: {0} KB/s"), self.max_bandwidth_kb)
+            log_manager.log_formatted_event("SABNZBD", N_("SABnzbd未配置最大带宽，使用默认值: {0} KB/s"), self.max_bandwidth_kb)
 
     def _make_api_request(self, params, add_timestamp=True):
         """发送API请求到SABnzbd"""
@@ -59,11 +59,11 @@ class Sabnzbd(DownloaderBase):
                     # 空响应可能表示成功
                     return {'status': True, 'message': 'empty_success'}
             else:
-                log_manager.log_formatted_event("SABNZBD_ERROR", _("SABnzbd API请求失败: HTTP {0}"), response.status_code)
+                log_manager.log_formatted_event("SABNZBD_ERROR", N_("SABnzbd API请求失败: HTTP {0}"), response.status_code)
                 return None
                 
         except requests.exceptions.RequestException as e:
-            log_manager.log_formatted_event("SABNZBD_ERROR", _("SABnzbd API请求时出错: {0}"), str(e))
+            log_manager.log_formatted_event("SABNZBD_ERROR", N_("SABnzbd API请求时出错: {0}"), str(e))
             return None
 
     def _set_max_bandwidth(self, max_bandwidth_kb):
@@ -121,20 +121,20 @@ class Sabnzbd(DownloaderBase):
                 try:
                     result = response.json()
                     if result.get('value', {}).get('success') == True:
-                        log_manager.log_formatted_event("SABNZBD", _("SABnzbd最大带宽设置成功: {0}"), bandwidth_str)
+                        log_manager.log_formatted_event("SABNZBD", N_("SABnzbd最大带宽设置成功: {0}"), bandwidth_str)
                         return True
                     else:
-                        log_manager.log_formatted_event("SABNZBD_ERROR", _("SABnzbd最大带宽设置失败: {0}"), str(result))
+                        log_manager.log_formatted_event("SABNZBD_ERROR", N_("SABnzbd最大带宽设置失败: {0}"), str(result))
                         return False
                 except json.JSONDecodeError:
-                    log_manager.log_event("SABNZBD_ERROR", _("SABnzbd最大带宽设置响应不是有效JSON"))
+                    log_manager.log_event("SABNZBD_ERROR", N_("SABnzbd最大带宽设置响应不是有效JSON"))
                     return False
             else:
-                log_manager.log_formatted_event("SABNZBD_ERROR", _("SABnzbd最大带宽设置请求失败: HTTP {0}"), response.status_code)
+                log_manager.log_formatted_event("SABNZBD_ERROR", N_("SABnzbd最大带宽设置请求失败: HTTP {0}"), response.status_code)
                 return False
                 
         except Exception as e:
-            log_manager.log_formatted_event("SABNZBD_ERROR", _("设置SABnzbd最大带宽时出错: {0}"), str(e))
+            log_manager.log_formatted_event("SABNZBD_ERROR", N_("设置SABnzbd最大带宽时出错: {0}"), str(e))
             return False
 
     def _kb_to_percentage(self, target_kb):
@@ -178,16 +178,16 @@ class Sabnzbd(DownloaderBase):
                     if self._verify_speed_setting(percentage):
                         success = True
                     else:
-                        log_manager.log_formatted_event("SABNZBD_ERROR", _("SABnzbd限速验证失败，期望: {0}%"), percentage)
+                        log_manager.log_formatted_event("SABNZBD_ERROR", N_("SABnzbd限速验证失败，期望: {0}%"), percentage)
                         success = False
                 else:
-                    log_manager.log_event("SABNZBD_ERROR", _("SABnzbd限速设置请求失败"))
+                    log_manager.log_event("SABNZBD_ERROR", N_("SABnzbd限速设置请求失败"))
                     success = False
             
             return success
             
         except Exception as e:
-            log_manager.log_formatted_event("SABNZBD_ERROR", _("设置SABnzbd速度限制时出错: {0}"), str(e))
+            log_manager.log_formatted_event("SABNZBD_ERROR", N_("设置SABnzbd速度限制时出错: {0}"), str(e))
             return False
 
     def _verify_speed_setting(self, expected_percentage):
@@ -213,14 +213,14 @@ class Sabnzbd(DownloaderBase):
                             if abs(current_limit - expected_percentage) <= 2:
                                 return True
                             else:
-                                log_manager.log_formatted_event("SABNZBD_ERROR", _("限速验证失败: 期望{0}%, 实际{1}%"), expected_percentage, current_limit)
+                                log_manager.log_formatted_event("SABNZBD_ERROR", N_("限速验证失败: 期望{0}%, 实际{1}%"), expected_percentage, current_limit)
                     except (ValueError, TypeError):
-                        log_manager.log_formatted_event("SABNZBD_ERROR", _("无法解析当前限速值: {0}"), current_limit_str)
+                        log_manager.log_formatted_event("SABNZBD_ERROR", N_("无法解析当前限速值: {0}"), current_limit_str)
                         
             return False
             
         except Exception as e:
-            log_manager.log_formatted_event("SABNZBD_ERROR", _("验证SABnzbd速度设置时出错: {0}"), str(e))
+            log_manager.log_formatted_event("SABNZBD_ERROR", N_("验证SABnzbd速度设置时出错: {0}"), str(e))
             return False
 
     def test_connection(self):
@@ -245,36 +245,65 @@ class Sabnzbd(DownloaderBase):
         except Exception as e:
             return False, _("连接测试失败: {0}").format(str(e))
 
+    def _get_queue_info(self):
+        """获取队列信息，其中包含当前下载速度和限速百分比"""
+        queue_response = self._make_api_request({'mode': 'queue'}, add_timestamp=False)
+        if queue_response and 'queue' in queue_response:
+            return queue_response['queue']
+        return None
+
+    def _speeds_from_queue(self, queue_info):
+        # 获取实际下载速度（KB/s）
+        kbpersec_str = queue_info.get('kbpersec', '0')
+        try:
+            download_speed = float(kbpersec_str)
+        except (ValueError, TypeError):
+            download_speed = 0.0
+        
+        # 获取当前限速百分比
+        speedlimit_str = queue_info.get('speedlimit', '0')
+        try:
+            current_limit_percentage = int(float(speedlimit_str))
+        except (ValueError, TypeError):
+            current_limit_percentage = 0
+        
+        return {
+            'download_speed': download_speed,
+            'upload_speed': 0,  # SABnzbd不支持上传
+            'current_limit_percentage': current_limit_percentage  # 添加这个字段供前端显示
+        }
+
     def get_current_speeds(self):
         """获取当前下载和上传速度"""
+        current_speeds, _limits = self.sample()
+        return current_speeds
+
+    def get_speed_limits(self):
+        """读取当前下载限速百分比（上传不支持，固定为0）"""
+        _speeds, limits = self.sample(read_limits=True)
+        return limits
+
+    def sample(self, read_limits=False):
+        """一次队列请求同时取得当前速度和限速百分比"""
         try:
-            queue_response = self._make_api_request({'mode': 'queue'}, add_timestamp=False)
+            queue_info = self._get_queue_info()
+            if queue_info is None:
+                return {'download_speed': 0, 'upload_speed': 0, 'current_limit_percentage': 0}, None
             
-            if queue_response and 'queue' in queue_response:
-                queue_info = queue_response['queue']
-                
-                # 获取实际下载速度（KB/s）
-                kbpersec_str = queue_info.get('kbpersec', '0')
-                try:
-                    download_speed = float(kbpersec_str)
-                except (ValueError, TypeError):
-                    download_speed = 0.0
-                
-                # 获取当前限速百分比
-                speedlimit_str = queue_info.get('speedlimit', '0')
-                try:
-                    current_limit_percentage = int(float(speedlimit_str))
-                except (ValueError, TypeError):
-                    current_limit_percentage = 0
-                
-                return {
-                    'download_speed': download_speed,
-                    'upload_speed': 0,  # SABnzbd不支持上传
-                    'current_limit_percentage': current_limit_percentage  # 添加这个字段供前端显示
-                }
-            else:
-                return {'download_speed': 0, 'upload_speed': 0, 'current_limit_percentage': 0}
+            current_speeds = self._speeds_from_queue(queue_info)
+            limits = (current_speeds['current_limit_percentage'], 0) if read_limits else None
+            return current_speeds, limits
                 
         except Exception as e:
-            log_manager.log_formatted_event("SABNZBD_ERROR", _("获取SABnzbd速度信息时出错: {0}"), str(e))
-            return {'download_speed': 0, 'upload_speed': 0, 'current_limit_percentage': 0} 
\ No newline at end of file
+            log_manager.log_formatted_event("SABNZBD_ERROR", N_("获取SABnzbd速度信息时出错: {0}"), str(e))
+            return {'download_speed': 0, 'upload_speed': 0, 'current_limit_percentage': 0}, None
+
+    def limits_match(self, desired_limits, actual_limits):
+        """与 _verify_speed_setting 一致：只比较下载百分比，100%与0等价，允许±2的误差"""
+        desired_percentage, actual_percentage = desired_limits[0], actual_limits[0]
+        if desired_percentage <= 0:
+            # set_speed_limits 不会下发0，无需对账
+            return True
+        if desired_percentage == 100:
+            return actual_percentage in (0, 100)
+        return abs(actual_percentage - desired_percentage) <= 2
@@ -39,7 +39,8 @@ class Transmission(DownloaderBase):
                     })
                     return True
             elif response.status_code == 200:
-                # 某些版本可能不需要会话ID
+                # 某些版本可能不需要会话ID，记录一个占位值避免重复探测
+                self.session_id = ''
                 return True
                 
             log_manager.log_formatted_event("TRANSMISSION_ERROR", "获取Transmission会话ID失败: HTTP {0}", response.status_code)
@@ -51,7 +52,8 @@ class Transmission(DownloaderBase):
 
     def _make_rpc_request(self, method, arguments=None):
         """发送RPC请求到Transmission"""
-        if not self._get_session_id():
+        # 插件实例被长期复用，会话ID只在首次请求或失效时获取
+        if self.session_id is None and not self._get_session_id():
             return None
             
         try:
@@ -69,6 +71,24 @@ class Transmission(DownloaderBase):
                 timeout=10
             )
             
+            if response.status_code == 409:
+                # 会话ID已失效（例如Transmission重启），使用响应中的新ID重试一次
+                session_id = response.headers.get('X-Transmission-Session-Id')
+                if not session_id:
+                    self.session_id = None
+                    log_manager.log_formatted_event("TRANSMISSION_ERROR", "Transmission RPC请求失败: HTTP {0}", response.status_code)
+                    return None
+                self.session_id = session_id
+                self.session.headers.update({
+                    'X-Transmission-Session-Id': session_id
+                })
+                response = self.session.post(
+                    rpc_url, 
+                    json=rpc_data,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=10
+                )
+            
             if response.status_code == 200:
                 try:
                     return response.json()
@@ -118,6 +138,22 @@ class Transmission(DownloaderBase):
             log_manager.log_formatted_event("TRANSMISSION_ERROR", "Transmission设置速率限制时出错: {0}", str(e))
             return False
 
+    def get_speed_limits(self):
+        """读取全局速率限制，未启用的方向视为无限制"""
+        try:
+            response = self._make_rpc_request("session-get", {"fields": [
+                "speed-limit-down-enabled", "speed-limit-down", "speed-limit-up-enabled", "speed-limit-up"
+            ]})
+            if not response or response.get("result") != "success":
+                return None
+            arguments = response.get("arguments", {})
+            download_limit = int(arguments.get("speed-limit-down", 0)) if arguments.get("speed-limit-down-enabled") else 0
+            upload_limit = int(arguments.get("speed-limit-up", 0)) if arguments.get("speed-limit-up-enabled") else 0
+            return download_limit, upload_limit
+        except Exception as e:
+            log_manager.log_formatted_event("TRANSMISSION_ERROR", "读取Transmission速率限制时出错: {0}", str(e))
+            return None
+
     def test_connection(self):
         """测试连接"""
         if not self.url:
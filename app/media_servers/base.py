@@ -38,4 +38,13 @@ class MediaServerBase(ABC):
         - Emby/Jellyfin: 只能获取媒体文件的编码比特率，非实时网络速度
         :return: {'total_bitrate': float, 'sessions': [{'user_name': str, 'bitrate': float}]} 或 None
         """
-        return None 
\ No newline at end of file
+        return None
+
+    def close(self):
+        """
+        释放插件持有的连接资源。
+        插件实例会被插件池长期复用，只有在配置变化或实例删除时才会被关闭。
+        """
+        session = getattr(self, 'session', None)
+        if session is not None:
+            session.close() 
\ No newline at end of file
@@ -155,8 +155,8 @@ class Plex(MediaServerBase):
                 'User-Agent': 'Auto-Limit/1.0'
             }
             
-            # 使用独立的requests.get调用，避免session的XML Accept头冲突
-            response = requests.get(bandwidth_url, params=params, headers=headers, timeout=10)
+            # 复用session的长连接，请求级的Accept头会覆盖session默认的XML Accept头
+            response = self.session.get(bandwidth_url, params=params, headers=headers, timeout=10)
             
             if response.status_code == 200:
                 try:
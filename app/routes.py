@@ -1,10 +1,14 @@
+import json
 import re
 import uuid
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, session, flash
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, session, flash, stream_with_context
 from flask_babel import _, get_locale
 from .services.config_manager import config_manager
-from .services.log_manager import log_manager
+from .services.log_manager import log_manager, N_
 from .services.scheduler import scheduler
+from .services.event_bus import event_bus
+from .services.token_store import token_store
+from .services.circuit_breaker import circuit_breakers
 from .auth import login_required, login_user, logout_user, get_current_user
 
 main = Blueprint('main', __name__)
@@ -69,7 +73,7 @@ def config():
         new_settings = parse_form_data(form_data)
 
         # 获取当前的settings，主要是为了保留rates和scheduler
-        settings = config_manager.get_settings()
+        settings = config_manager.get_editable_settings()
         
         # 清理已删除的实例并更新或添加新实例
         for instance_type in ['media_servers', 'downloaders']:
@@ -91,8 +95,8 @@ def config():
                  settings['scheduler'][key] = int(value) if value.isdigit() else 15
 
         config_manager.save_settings(settings)
-        log_manager.log_event("CONFIG", _("配置已更新，调度器将重启以应用新设置"))
-        scheduler.restart()
+        log_manager.log_event("CONFIG", N_("配置已更新，调度器将增量应用新设置"))
+        scheduler.reconfigure()
         return redirect(url_for('main.index'))
     
     settings = config_manager.get_settings()
@@ -103,11 +107,42 @@ def config():
     }
     return render_template('config.html', settings=settings, available_plugins=available_plugins)
 
+LOGS_PAGE_SIZE = 100
+
+def _parse_log_query():
+    """解析日志查询参数：before（游标）、type（可重复或逗号分隔）、limit"""
+    before_id = request.args.get('before', type=int)
+    types = [t for value in request.args.getlist('type') for t in value.split(',') if t]
+    limit = min(max(request.args.get('limit', LOGS_PAGE_SIZE, type=int), 1), 500)
+    return before_id, types, limit
+
 @main.route('/logs')
 @login_required
 def logs_page():
-    logs = log_manager.get_logs()
-    return render_template('logs.html', logs=logs)
+    before_id, types, limit = _parse_log_query()
+    logs, next_cursor = log_manager.query_logs(before_id=before_id, types=types, limit=limit)
+    return render_template(
+        'logs.html',
+        logs=logs,
+        next_cursor=next_cursor,
+        log_types=log_manager.get_log_types(),
+        selected_type=types[0] if len(types) == 1 else ''
+    )
+
+@main.route('/api/logs')
+@login_required
+def api_logs():
+    """
+    按游标分页查询日志。
+    参数：before 为上一页返回的 next_cursor，type 按事件类型过滤（如 SPEED_CHANGE、QB_ERROR），limit 为每页条数。
+    """
+    before_id, types, limit = _parse_log_query()
+    logs, next_cursor = log_manager.query_logs(before_id=before_id, types=types, limit=limit)
+    return jsonify({
+        'status': 'success',
+        'logs': logs,
+        'next_cursor': next_cursor
+    })
 
 @main.route('/api/status')
 @login_required
@@ -115,7 +150,10 @@ def api_status():
     return jsonify({
         'active_sessions': len(scheduler.active_session_ids),
         'sessions': list(scheduler.active_session_ids),
-        'running': scheduler.running
+        'running': scheduler.running,
+        'ticks': scheduler.get_tick_stats(),
+        'speed_changes': scheduler.get_apply_results(),
+        'circuit_breakers': circuit_breakers.get_states()
     })
 
 @main.route('/test_connection', methods=['POST'])
@@ -128,7 +166,8 @@ def test_connection():
     if not instance_config or not plugin_type_plural:
         return jsonify({'status': 'error', 'message': '无效的请求'}), 400
 
-    instance = scheduler._get_plugin_instance(plugin_type_plural, instance_config)
+    # 测试的配置可能尚未保存，使用独立实例，避免污染插件池
+    instance = scheduler._get_plugin_instance(plugin_type_plural, instance_config, pooled=False)
     if not instance:
         return jsonify({'status': 'error', 'message': f'无法加载插件 {instance_config.get("type")}'}), 404
         
@@ -137,121 +176,119 @@ def test_connection():
     plugin_name = instance_config.get("type", "UNKNOWN").upper()
     log_event_type = f"TEST_{plugin_name}"
     if success:
-        log_manager.log_formatted_event(log_event_type, _("连接测试成功: {0}"), message)
+        log_manager.log_formatted_event(log_event_type, N_("连接测试成功: {0}"), message)
         return jsonify({'status': 'success', 'message': f'连接成功: {message}'})
     else:
-        log_manager.log_formatted_event(f"{log_event_type}_ERROR", _("连接测试失败: {0}"), message)
+        log_manager.log_formatted_event(f"{log_event_type}_ERROR", N_("连接测试失败: {0}"), message)
         return jsonify({'status': 'error', 'message': f'连接失败: {message}'}), 400
 
 @main.route('/api/media_server/sessions')
 @login_required
 def api_media_server_sessions():
-    sessions = []
-    total_sessions = 0
-    settings = config_manager.get_settings()
-
-    for server_instance in settings.get('media_servers', []):
-        if server_instance.get('enabled'):
-            media_server = scheduler._get_plugin_instance('media_servers', server_instance)
-            if media_server:
-                current_sessions = media_server.get_active_sessions()
-                if current_sessions:
-                    # 为每个会话添加来源服务器信息
-                    for session in current_sessions:
-                        session['source_server'] = server_instance.get('name', server_instance.get('id', '未知服务器'))
-                    sessions.extend(current_sessions)
-                    total_sessions += len(current_sessions)
-    
-    if sessions:
-        return jsonify({'status': 'success', 'sessions': sessions, 'count': total_sessions})
-    else:
-        return jsonify({'status': 'success', 'sessions': [], 'count': 0})
+    """获取所有媒体服务器的播放会话（来自调度器的轮询快照，不访问上游服务器）"""
+    sessions, updated_at = scheduler.get_sessions_snapshot()
+    return jsonify({'status': 'success', 'sessions': sessions, 'count': len(sessions), 'updated_at': updated_at})
 
 @main.route('/api/media_server/speeds')
 @login_required
 def api_media_server_speeds():
-    """获取所有媒体服务器的网络速度信息
+    """获取所有媒体服务器的网络速度信息（来自调度器的轮询快照）
     注意：Plex返回真实网络传输速度，Emby/Jellyfin返回媒体文件比特率"""
-    total_bitrate = 0
-    all_sessions = []
-    settings = config_manager.get_settings()
-    
-    for server_instance in settings.get('media_servers', []):
-        if server_instance.get('enabled'):
-            media_server = scheduler._get_plugin_instance('media_servers', server_instance)
-            if media_server and hasattr(media_server, 'get_network_speeds'):
-                try:
-                    speed_info = media_server.get_network_speeds()
-                    if speed_info:
-                        server_name = server_instance.get('name', server_instance.get('id', '未知服务器'))
-                        total_bitrate += speed_info.get('total_bitrate', 0)
-                        
-                        # 为每个会话添加服务器信息
-                        for session in speed_info.get('sessions', []):
-                            session['source_server'] = server_name
-                            session['source_server_type'] = server_instance.get('type', '未知类型')
-                            all_sessions.append(session)
-                except Exception as e:
-                    current_app.logger.warning(f"获取媒体服务器 {server_instance.get('name', '未知')} 网络速度失败: {e}")
-    
+    total_bitrate, all_sessions, updated_at = scheduler.get_speeds_snapshot()
     return jsonify({
         'status': 'success',
         'total_bitrate': total_bitrate,
-        'sessions': all_sessions
+        'sessions': all_sessions,
+        'updated_at': updated_at
     })
 
 @main.route('/api/downloaders/status')
 @login_required
 def api_downloaders_status():
     """获取所有下载器的状态信息"""
-    downloaders_status = []
-    settings = config_manager.get_settings()
+    return jsonify(scheduler.get_downloaders_status())
+
+@main.route('/api/dashboard')
+@login_required
+def api_dashboard():
+    """
+    仪表盘聚合接口：一次返回首页渲染所需的全部数据。
+    ETag 基于调度器的状态版本号，状态未变化时返回 304 且不带响应体。
+    """
+    etag = scheduler.get_dashboard_etag()
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    response = jsonify(scheduler.get_dashboard_state())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@main.route('/api/logs/export')
+@login_required
+def api_logs_export():
+    """
+    以JSON Lines格式流式导出全部历史日志，按时间从旧到新，每条日志只出现一次。
+    """
+    def generate():
+        for entry in log_manager.iter_export():
+            yield json.dumps(entry, ensure_ascii=False) + '\n'
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename=auto-limit-logs.jsonl'
+    return response
+
+@main.route('/api/events')
+@login_required
+def api_events():
+    """
+    Server-Sent Events 推送通道。
+    channels 参数可选 dashboard、logs（逗号分隔），默认全部订阅。
+    dashboard 事件携带完整的仪表盘数据，logs 事件携带新的日志条目。
+    """
+    channels = [c for c in request.args.get('channels', '').split(',') if c in event_bus.CHANNELS]
+    subscription = event_bus.subscribe(channels)
     
-    # 判断当前是否有播放活动
-    has_active_sessions = len(scheduler.active_session_ids) > 0
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
     
-    for downloader_instance in settings.get('downloaders', []):
-        if downloader_instance.get('enabled'):
-            downloader = scheduler._get_plugin_instance('downloaders', downloader_instance)
-            if downloader:
-                # 安全地获取当前实际速度
-                current_speeds = None
-                try:
-                    current_speeds = downloader.get_current_speeds()
-                except Exception as e:
-                    current_app.logger.warning(f"获取下载器 {downloader_instance.get('name', '未知')} 速度失败: {e}")
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            if 'dashboard' in subscription.channels:
+                yield format_event('dashboard', scheduler.get_dashboard_state())
+            
+            while True:
+                item = subscription.get(timeout=15)
+                if item is None:
+                    # 保活注释，防止代理断开空闲连接
+                    yield ": keepalive\n\n"
+                    continue
                 
-                # 确定当前应该使用的限速配置
-                if has_active_sessions:
-                    # 播放时限速
-                    active_download_limit = downloader_instance.get('backup_download_limit', 1024)
-                    active_upload_limit = downloader_instance.get('backup_upload_limit', 512)
-                    speed_mode = 'playing'
+                channel, data = item
+                if channel == 'dashboard':
+                    # 合并积压的仪表盘通知，只推送最新状态
+                    pending_logs = []
+                    while True:
+                        next_item = subscription.get(timeout=0)
+                        if next_item is None:
+                            break
+                        if next_item[0] == 'logs':
+                            pending_logs.append(next_item[1])
+                    yield format_event('dashboard', scheduler.get_dashboard_state())
+                    for entry in pending_logs:
+                        yield format_event('log', log_manager.render_entry(entry))
                 else:
-                    # 默认限速
-                    active_download_limit = downloader_instance.get('default_download_limit', 0)
-                    active_upload_limit = downloader_instance.get('default_upload_limit', 0)
-                    speed_mode = 'default'
-                
-                downloader_status = {
-                    'id': downloader_instance.get('id'),
-                    'name': downloader_instance.get('name', '未命名'),
-                    'type': downloader_instance.get('type'),
-                    'speed_mode': speed_mode,
-                    'active_limits': {
-                        'download': active_download_limit,
-                        'upload': active_upload_limit
-                    },
-                    'current_speeds': current_speeds
-                }
-                
-                downloaders_status.append(downloader_status)
+                    yield format_event('log', log_manager.render_entry(data))
+        finally:
+            event_bus.unsubscribe(subscription)
     
-    return jsonify({
-        'status': 'success', 
-        'downloaders': downloaders_status,
-        'has_active_sessions': has_active_sessions
-    })
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @main.route('/health')
 @login_required
@@ -274,22 +311,18 @@ def save_instance():
             return jsonify({'status': 'error', 'message': '无效的请求数据'}), 400
         
         # 获取当前设置
-        settings = config_manager.get_settings()
+        settings = config_manager.get_editable_settings()
         
         # 确保实例类型存在
         if instance_type not in settings:
             settings[instance_type] = []
         
-        # 查找现有实例或创建新实例
+        # 通过ID索引查找现有实例或创建新实例
         instance_id = instance_config.get('id')
         found_index = -1
         
         if instance_id and 'INDEX' not in instance_id:
-            # 查找现有实例
-            for i, existing in enumerate(settings[instance_type]):
-                if existing.get('id') == instance_id:
-                    found_index = i
-                    break
+            found_index = config_manager.find_instance_position(instance_type, instance_id)
         
         # 为新实例生成ID
         if not instance_id or 'INDEX' in instance_id:
@@ -314,19 +347,28 @@ def save_instance():
         if instance_type == 'media_servers':
             poll_interval = instance_config.get('poll_interval', 15)
             instance_config['poll_interval'] = int(poll_interval) if str(poll_interval).isdigit() and int(poll_interval) >= 5 else 15
+            
+            # 自适应轮询：最小间隔不少于2秒，最大间隔不小于最小间隔且不超过600秒
+            instance_config['adaptive_polling'] = bool(instance_config.get('adaptive_polling', False))
+            min_poll_interval = instance_config.get('min_poll_interval', 5)
+            min_poll_interval = int(min_poll_interval) if str(min_poll_interval).isdigit() and int(min_poll_interval) >= 2 else 5
+            max_poll_interval = instance_config.get('max_poll_interval', 120)
+            max_poll_interval = int(max_poll_interval) if str(max_poll_interval).isdigit() else 120
+            instance_config['min_poll_interval'] = min_poll_interval
+            instance_config['max_poll_interval'] = min(max(max_poll_interval, min_poll_interval), 600)
         
         # 更新或添加实例
         if found_index >= 0:
             settings[instance_type][found_index] = instance_config
-            log_manager.log_formatted_event("CONFIG", _("更新了{0}实例配置"), instance_config.get('name', '未命名'))
+            log_manager.log_formatted_event("CONFIG", N_("更新了{0}实例配置"), instance_config.get('name', '未命名'))
         else:
             settings[instance_type].append(instance_config)
-            log_manager.log_formatted_event("CONFIG", _("添加了新的{0}实例"), instance_config.get('name', '未命名'))
+            log_manager.log_formatted_event("CONFIG", N_("添加了新的{0}实例"), instance_config.get('name', '未命名'))
         
         # 保存设置
         if config_manager.save_settings(settings):
-            # 重启调度器以应用新配置
-            scheduler.restart()
+            # 只重新调度受影响的实例
+            scheduler.reconfigure()
             return jsonify({
                 'status': 'success', 
                 'message': '实例配置保存成功',
@@ -352,21 +394,17 @@ def delete_instance():
             return jsonify({'status': 'error', 'message': '无效的请求数据'}), 400
         
         # 获取当前设置
-        settings = config_manager.get_settings()
+        settings = config_manager.get_editable_settings()
         
         # 确保实例类型存在
         if instance_type not in settings:
             return jsonify({'status': 'error', 'message': '实例类型不存在'}), 404
         
-        # 查找并删除实例
-        found_index = -1
+        # 通过ID索引查找并删除实例
+        found_index = config_manager.find_instance_position(instance_type, instance_id)
         instance_name = '未知实例'
-        
-        for i, existing in enumerate(settings[instance_type]):
-            if existing.get('id') == instance_id:
-                found_index = i
-                instance_name = existing.get('name', '未命名')
-                break
+        if found_index >= 0:
+            instance_name = settings[instance_type][found_index].get('name', '未命名')
         
         if found_index >= 0:
             # 删除实例
@@ -374,9 +412,10 @@ def delete_instance():
             
             # 保存设置
             if config_manager.save_settings(settings):
-                log_manager.log_formatted_event("CONFIG", _("删除了{0}实例"), instance_name)
-                # 重启调度器以应用新配置
-                scheduler.restart()
+                token_store.discard(instance_id)
+                log_manager.log_formatted_event("CONFIG", N_("删除了{0}实例"), instance_name)
+                # 只重新调度受影响的实例
+                scheduler.reconfigure()
                 return jsonify({
                     'status': 'success', 
                     'message': '实例删除成功'
@@ -411,10 +450,10 @@ def login_post():
     
     if config_manager.verify_password(username, password):
         login_user(username)
-        log_manager.log_formatted_event("AUTH", _("用户 {0} 登录成功"), username)
+        log_manager.log_formatted_event("AUTH", N_("用户 {0} 登录成功"), username)
         return redirect(url_for('main.index'))
     else:
-        log_manager.log_formatted_event("AUTH", _("用户 {0} 登录失败"), username)
+        log_manager.log_formatted_event("AUTH", N_("用户 {0} 登录失败"), username)
         flash(_('用户名或密码错误'), 'error')
         return redirect(url_for('auth.login'))
 
@@ -424,7 +463,7 @@ def logout():
     username = get_current_user()
     logout_user()
     if username:
-        log_manager.log_formatted_event("AUTH", _("用户 {0} 已登出"), username)
+        log_manager.log_formatted_event("AUTH", N_("用户 {0} 已登出"), username)
     return redirect(url_for('auth.login'))
 
 @auth.route('/setup')
@@ -460,7 +499,7 @@ def setup_post():
         return redirect(url_for('auth.setup'))
     
     if config_manager.set_auth_credentials(username, password):
-        log_manager.log_formatted_event("AUTH", _("用户 {0} 完成首次设置"), username)
+        log_manager.log_formatted_event("AUTH", N_("用户 {0} 完成首次设置"), username)
         # 直接登录用户并重定向到主页
         login_user(username)
         flash(_('设置完成，欢迎使用Auto-Limit！'), 'success')
@@ -0,0 +1,189 @@
+from threading import Lock
+from time import time, monotonic
+import requests
+from requests.adapters import HTTPAdapter
+from .log_manager import log_manager, N_
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """断路器处于断开状态时直接拒绝请求，插件按连接失败处理"""
+
+class CircuitBreaker:
+    """
+    单个媒体服务器或下载器实例的断路器。
+    连续失败达到阈值后断开，断开期间的请求立即失败而不再等待超时；
+    到达重试时间后放行一个探测请求（半开），成功则闭合，失败则以翻倍的退避时间再次断开。
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=3, base_backoff=5.0, max_backoff=300.0, listener=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.listener = listener  # 状态变化时调用，无参数
+        self.state = self.CLOSED
+        self.failures = 0  # 连续失败次数
+        self.backoff = base_backoff  # 下一次断开的时长（秒）
+        self.retry_at = 0.0  # 断开状态下允许探测的 monotonic 时间
+        self.probing = False  # 半开状态下是否已有探测请求在进行
+        self.opened_at = None
+        self.last_error = None
+        self.lock = Lock()
+
+    def allow(self):
+        """
+        判断是否放行一次请求。
+        :return: 可以发起请求时返回 True
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and monotonic() >= self.retry_at:
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def release(self):
+        """放弃本次探测，不改变断路器状态"""
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            recovered = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.failures = 0
+            self.backoff = self.base_backoff
+            self.probing = False
+            self.opened_at = None
+            self.last_error = None
+        if recovered:
+            log_manager.log_formatted_event("SCHEDULER", N_("{0} 已恢复连接，断路器闭合"), self.name)
+            self._notify()
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == self.HALF_OPEN:
+                # 探测失败：退避时间翻倍后再次断开
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+            elif self.state == self.OPEN or self.failures < self.failure_threshold:
+                return
+            self.state = self.OPEN
+            self.probing = False
+            self.opened_at = self.opened_at or time()
+            self.retry_at = monotonic() + self.backoff
+            backoff = self.backoff
+        log_manager.log_formatted_event("SCHEDULER_ERROR", N_("{0} 连续失败 {1} 次，断路器断开，{2} 秒后重试"),
+                                       self.name, self.failures, backoff)
+        self._notify()
+
+    def _notify(self):
+        if self.listener:
+            self.listener()
+
+    def snapshot(self):
+        """断路器当前状态，供状态API使用"""
+        with self.lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'backoff': self.backoff,
+                'retry_in': max(0.0, self.retry_at - monotonic()) if self.state == self.OPEN else 0.0,
+                'opened_at': self.opened_at,
+                'last_error': self.last_error
+            }
+
+class CircuitBreakerAdapter(HTTPAdapter):
+    """
+    挂载到插件 requests.Session 上的传输适配器。
+    插件的所有HTTP调用都经过断路器：断开时立即抛出 CircuitOpenError，
+    连接错误、超时和5xx响应计为失败，其余响应计为成功。
+    """
+    def __init__(self, breaker, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+
+    def send(self, request, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} 断路器已断开", request=request)
+        try:
+            response = super().send(request, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            self.breaker.record_failure(e)
+            raise
+        except Exception:
+            # 其他异常（例如请求构造错误）与主机是否可用无关，只释放探测名额
+            self.breaker.release()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            self.breaker.record_success()
+        return response
+
+class CircuitBreakerRegistry:
+    """按 (插件类型, 实例ID) 管理断路器，实例配置变化或被删除时才重置"""
+    def __init__(self):
+        self.breakers = {}
+        self.lock = Lock()
+        self.failure_threshold = 3
+        self.base_backoff = 5.0
+        self.max_backoff = 300.0
+        self.listener = None
+
+    def configure(self, scheduler_settings):
+        """应用断路器参数，只影响之后创建的断路器"""
+        self.failure_threshold = max(1, int(scheduler_settings.get('breaker_failure_threshold', self.failure_threshold)))
+        self.base_backoff = float(scheduler_settings.get('breaker_base_backoff', self.base_backoff))
+        self.max_backoff = max(self.base_backoff, float(scheduler_settings.get('breaker_max_backoff', self.max_backoff)))
+
+    def get(self, plugin_type_plural, instance_config):
+        key = (plugin_type_plural, instance_config.get('id'))
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    instance_config.get('name') or instance_config.get('id'),
+                    self.failure_threshold, self.base_backoff, self.max_backoff, self.listener
+                )
+                self.breakers[key] = breaker
+            return breaker
+
+    def attach(self, plugin_type_plural, instance_config, plugin):
+        """把实例的断路器挂载到插件的 requests.Session 上（插件没有 session 时不做任何事）"""
+        session = getattr(plugin, 'session', None)
+        if not isinstance(session, requests.Session):
+            return
+        adapter = CircuitBreakerAdapter(self.get(plugin_type_plural, instance_config))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    def reset(self, plugin_type_plural, instance_id):
+        """实例配置变化或被删除时丢弃断路器，新配置从闭合状态开始"""
+        with self.lock:
+            self.breakers.pop((plugin_type_plural, instance_id), None)
+
+    def get_states(self):
+        """
+        所有断路器的状态。
+        :return: {plugin_type_plural: {instance_id: snapshot}}
+        """
+        with self.lock:
+            items = list(self.breakers.items())
+        states = {'media_servers': {}, 'downloaders': {}}
+        for (plugin_type_plural, instance_id), breaker in items:
+            states.setdefault(plugin_type_plural, {})[instance_id] = breaker.snapshot()
+        return states
+
+    def get_state(self, plugin_type_plural, instance_id):
+        breaker = self.breakers.get((plugin_type_plural, instance_id))
+        return breaker.snapshot() if breaker else None
+
+circuit_breakers = CircuitBreakerRegistry()
@@ -1,18 +1,54 @@
 import json
 import os
+import tempfile
+from collections import namedtuple
 from flask import current_app
 import uuid
 from threading import Lock
 import bcrypt
+from ..utils import WhitelistMatcher
+
+class FrozenDict(dict):
+    """只读字典，配置快照中的所有字典都会转换为此类型（与 dict 一样按内容比较，因此不可哈希）"""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("配置快照是只读的，请通过 config_manager.get_editable_settings() 获取可修改的副本")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+def freeze(value):
+    """递归地把字典和列表转换为只读的 FrozenDict 和 tuple"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value):
+    """递归地把只读快照转换回可修改的 dict 和 list"""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+# 配置快照：version 单调递增，settings 为只读的完整配置；
+# instances 为 {实例类型: {实例ID: (在列表中的位置, 实例配置)}}，enabled 为 {实例类型: 启用实例的元组}，
+# whitelists 为 {媒体服务器ID: WhitelistMatcher}，
+# 均在发布快照时一次性建立，查找实例不再需要遍历列表，白名单规则每个配置版本只编译一次
+ConfigSnapshot = namedtuple('ConfigSnapshot', ['version', 'settings', 'instances', 'enabled', 'whitelists'])
 
 class ConfigManager:
     """
     负责管理应用配置的类，所有配置读写通过此类进行。
+    配置以只读快照的形式发布：读取无锁、无拷贝，保存时生成新快照并原子替换，版本号加一。
     """
+    INSTANCE_TYPES = ('media_servers', 'downloaders')
+
     def __init__(self):
         self.config_path = None
-        self.settings = {}
-        self.lock = Lock()
+        self.snapshot = self._build_snapshot(0, freeze({}))
+        self.lock = Lock()  # 只用于串行化写入
         self.app = None
 
     def init_app(self, app):
@@ -33,7 +69,34 @@ class ConfigManager:
                 'backup_upload_limit': 512
             },
             'scheduler': {
-                'poll_interval': 15
+                'poll_interval': 15,
+                'poll_workers': 0,  # 轮询媒体服务器的线程数，0 表示按启用的服务器数自动调整，慢速或无响应的主机各占用一个线程
+                'apply_workers': 0,  # 并发采样和下发下载器限速的线程数，0 表示按启用的下载器数自动调整
+                'call_timeout': 12,  # 单次下载器调用的截止时间（秒），用于速度采样和并发下发速率
+                'sample_interval': 5,  # 下载器速度采样间隔（秒），仪表盘读取的是采样快照
+                'reconcile_interval': 60,  # 读回下载器实际限速并纠正偏差的间隔（秒），随速度采样一起进行，0 表示关闭
+                'engage_delay': 0,  # 出现需要限速的播放后，持续多少秒才切换到播放限速
+                'release_delay': 30,  # 播放全部停止后，持续多少秒才恢复默认限速
+                'min_hold': 60,  # 启用播放限速后至少保持的秒数，只推迟恢复默认限速，不推迟启用限速
+                'release_ramp_steps': 0,  # 恢复默认限速时的中间步数，每步速率翻倍，0 表示直接恢复
+                'release_ramp_interval': 10,  # 逐级恢复时每一步的间隔（秒）
+                'breaker_failure_threshold': 3,  # 实例连续失败多少次后断路器断开
+                'breaker_base_backoff': 5,  # 断路器首次断开的时长（秒），每次探测失败翻倍
+                'breaker_max_backoff': 300  # 断路器断开时长的上限（秒）
+            },
+            'logging': {
+                'backend': 'jsonl',  # 日志存储：'jsonl' 分段文件，'sqlite' 带索引的数据库
+                'retention_days': 90,  # 日志保留的天数
+                'retention_bytes': 52428800,  # jsonl 存储所有段的总大小上限（字节）
+                'segment_max_bytes': 1048576,  # jsonl 活动段超过该大小（字节）后封存并压缩
+                'segment_max_age': 86400,  # jsonl 活动段超过该时长（秒）后封存并压缩
+                'max_entries': 500,  # 内存环形缓冲区保留的条数
+                'durability': 'batch',  # 落盘策略：'async' 批量写入不fsync，'batch' 每批fsync，'sync' 每条同步写入并fsync
+                'flush_interval': 1.0,  # 后台写入线程的最长攒批时间（秒）
+                'flush_batch_size': 100,  # 攒够多少条立即写入
+                'coalesce_window': 300,  # 相同的日志自首次出现起多少秒内合并为一条并累计次数
+                'rate_limit_burst': 30,  # 每个日志来源（类型加产生日志的实例）的令牌桶容量，0 表示不限流
+                'rate_limit_per_minute': 20  # 每个日志来源每分钟补充的令牌数
             },
             'ui': {
                 'language': 'en'  # 添加UI语言设置，默认英文
@@ -56,12 +119,14 @@ class ConfigManager:
                     with open(self.config_path, 'r', encoding='utf-8') as f:
                         loaded_settings = json.load(f)
                         # 合并默认设置和加载的设置
-                        self.settings = self.get_default_settings()
-                        self._merge_settings(self.settings, loaded_settings)
+                        settings = self.get_default_settings()
+                        self._merge_settings(settings, loaded_settings)
+                        self._publish(settings)
                         print(f"成功加载配置文件: {self.config_path}")
                 else:
                     print(f"配置文件不存在，创建默认配置: {self.config_path}")
-                    self.settings = self.get_default_settings()
+                    settings = self.get_default_settings()
+                    self._publish(settings)
                     # 确保数据目录存在
                     data_dir = os.path.dirname(self.config_path)
                     if not os.path.exists(data_dir):
@@ -70,8 +135,7 @@ class ConfigManager:
                     
                     # 尝试创建配置文件
                     try:
-                        with open(self.config_path, 'w', encoding='utf-8') as f:
-                            json.dump(self.settings, f, indent=4, ensure_ascii=False)
+                        self._write_settings_file(settings)
                         print(f"成功创建默认配置文件: {self.config_path}")
                     except IOError as e:
                         print(f"警告：无法创建配置文件 {self.config_path}: {e}")
@@ -79,7 +143,136 @@ class ConfigManager:
             except (json.JSONDecodeError, IOError) as e:
                 print(f"加载配置文件失败: {e}")
                 print("使用默认配置继续运行")
-                self.settings = self.get_default_settings()
+                self._publish(self.get_default_settings())
+
+    def reload_settings(self):
+        """
+        重新读取被外部修改的配置文件。
+        内容与当前快照一致时（例如本进程自己刚写入的文件）不做任何事。
+        :return: 发布了新快照时返回 True
+        :raises ValueError: 文件无法解析或未通过校验，此时当前快照保持不变
+        """
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            loaded_settings = json.load(f)
+        if not isinstance(loaded_settings, dict):
+            raise ValueError("配置文件的顶层必须是对象")
+        settings = self.get_default_settings()
+        self._merge_settings(settings, loaded_settings)
+        self.validate_settings(settings)
+
+        frozen = freeze(settings)
+        with self.lock:
+            if frozen == self.snapshot.settings:
+                return False
+            self.snapshot = self._build_snapshot(self.snapshot.version + 1, frozen)
+        return True
+
+    def validate_settings(self, settings):
+        """
+        检查配置的结构，确保调度器和插件可以安全使用。
+        :raises ValueError: 描述第一个发现的问题
+        """
+        for section in ('scheduler', 'logging', 'ui', 'auth'):
+            if not isinstance(settings.get(section), dict):
+                raise ValueError(f"'{section}' 必须是对象")
+        for key in ('poll_workers', 'apply_workers'):
+            try:
+                if int(settings['scheduler'].get(key, 0)) < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                raise ValueError(f"'scheduler.{key}' 必须是非负整数")
+        for key in ('engage_delay', 'release_delay', 'min_hold', 'release_ramp_steps', 'release_ramp_interval'):
+            try:
+                float(settings['scheduler'].get(key, 0))
+            except (TypeError, ValueError):
+                raise ValueError(f"'scheduler.{key}' 必须是数字")
+        for instance_type in self.INSTANCE_TYPES:
+            instances = settings.get(instance_type)
+            if not isinstance(instances, list):
+                raise ValueError(f"'{instance_type}' 必须是列表")
+            seen_ids = set()
+            for instance in instances:
+                if not isinstance(instance, dict):
+                    raise ValueError(f"'{instance_type}' 中的实例必须是对象")
+                instance_id = instance.get('id')
+                if instance_id and instance_id in seen_ids:
+                    raise ValueError(f"'{instance_type}' 中的实例ID重复: {instance_id}")
+                seen_ids.add(instance_id)
+                if not isinstance(instance.get('type'), str):
+                    raise ValueError(f"实例 {instance.get('name', instance_id)} 缺少'type'字段")
+                if instance_type == 'media_servers':
+                    try:
+                        float(instance.get('poll_interval', 15))
+                        if float(instance.get('min_poll_interval', 5)) <= 0:
+                            raise ValueError
+                        float(instance.get('max_poll_interval', 120))
+                    except (TypeError, ValueError):
+                        raise ValueError(f"实例 {instance.get('name', instance_id)} 的轮询间隔无效")
+
+    def _publish(self, settings):
+        """冻结配置并发布为新的快照（调用方需持有写锁）"""
+        self.snapshot = self._build_snapshot(self.snapshot.version + 1, freeze(settings))
+
+    def _build_snapshot(self, version, settings):
+        """为冻结的配置建立按ID索引的实例表和启用实例列表"""
+        instances = {}
+        enabled = {}
+        for instance_type in self.INSTANCE_TYPES:
+            by_id = {}
+            for position, instance in enumerate(settings.get(instance_type, ())):
+                instance_id = instance.get('id')
+                if instance_id:
+                    by_id[instance_id] = (position, instance)
+            instances[instance_type] = by_id
+            enabled[instance_type] = tuple(instance for _position, instance in by_id.values() if instance.get('enabled'))
+        whitelists = {server_id: WhitelistMatcher(server) for server_id, (_position, server) in instances['media_servers'].items()}
+        return ConfigSnapshot(version, settings, instances, enabled, whitelists)
+
+    def _write_settings_file(self, settings):
+        """通过临时文件和rename原子地写入配置文件"""
+        config_dir = os.path.dirname(self.config_path)
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                mode='w',
+                encoding='utf-8',
+                dir=config_dir,
+                prefix='config_',
+                suffix='.tmp',
+                delete=False
+            ) as temp_file:
+                temp_path = temp_file.name
+                json.dump(settings, temp_file, indent=4, ensure_ascii=False)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, self.config_path)
+        except OSError:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _update_settings(self, mutate):
+        """基于当前快照生成可修改的副本，修改后发布新快照并保存到文件"""
+        with self.lock:
+            settings = thaw(self.snapshot.settings)
+            mutate(settings)
+            self._publish(settings)
+            self._write_settings_file(settings)
+
+    def update_instance(self, instance_type, instance_id, mutate):
+        """
+        按ID定位单个实例并就地修改后保存，不遍历实例列表。
+        :return: 实例存在时返回 True
+        """
+        with self.lock:
+            entry = self.snapshot.instances.get(instance_type, {}).get(instance_id)
+            if not entry:
+                return False
+            settings = thaw(self.snapshot.settings)
+            mutate(settings[instance_type][entry[0]])
+            self._publish(settings)
+            self._write_settings_file(settings)
+            return True
 
     def _merge_settings(self, default, loaded):
         """递归合并设置"""
@@ -93,20 +286,60 @@ class ConfigManager:
                 default[key] = value
 
     def get_settings(self):
-        """获取当前配置"""
-        with self.lock:
-            return self.settings.copy()
+        """
+        获取当前配置的只读快照（无锁、无拷贝）。
+        需要修改配置时使用 get_editable_settings()。
+        """
+        return self.snapshot.settings
+
+    def get_version(self):
+        """获取当前配置版本号，每次保存加一"""
+        return self.snapshot.version
+
+    def get_instance(self, instance_type, instance_id):
+        """按ID获取实例配置（包括未启用的），不存在时返回 None"""
+        entry = self.snapshot.instances.get(instance_type, {}).get(instance_id)
+        return entry[1] if entry else None
+
+    def find_instance_position(self, instance_type, instance_id):
+        """按ID获取实例在配置列表中的位置，不存在时返回 -1"""
+        entry = self.snapshot.instances.get(instance_type, {}).get(instance_id)
+        return entry[0] if entry else -1
+
+    def get_enabled_instance(self, instance_type, instance_id):
+        """按ID获取启用的实例配置，不存在或未启用时返回 None"""
+        instance = self.get_instance(instance_type, instance_id)
+        return instance if instance and instance.get('enabled') else None
+
+    def get_enabled_media_servers(self):
+        """所有启用且有ID的媒体服务器配置"""
+        return self.snapshot.enabled.get('media_servers', ())
+
+    def get_enabled_downloaders(self):
+        """所有启用且有ID的下载器配置"""
+        return self.snapshot.enabled.get('downloaders', ())
+
+    def get_media_server(self, server_id):
+        """按ID获取启用的媒体服务器配置"""
+        return self.get_enabled_instance('media_servers', server_id)
+
+    def get_whitelist_matcher(self, server_id):
+        """按ID获取媒体服务器预编译的跳过限速规则，服务器不在当前配置中时返回 None"""
+        return self.snapshot.whitelists.get(server_id)
+
+    def get_editable_settings(self):
+        """获取当前配置的可修改副本，修改后通过 save_settings() 保存"""
+        return thaw(self.snapshot.settings)
 
     def save_settings(self, new_settings):
-        """保存配置到JSON文件"""
+        """发布新的配置快照并保存到JSON文件"""
         if self.config_path is None:
             raise RuntimeError("ConfigManager has not been initialized. Call init_app(app) first.")
         
         with self.lock:
-            self.settings = new_settings
+            self._publish(new_settings)
             try:
-                with open(self.config_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.settings, f, indent=4, ensure_ascii=False)
+                self._write_settings_file(new_settings)
                 print(f"成功保存配置文件: {self.config_path}")
                 return True
             except IOError as e:
@@ -115,24 +348,24 @@ class ConfigManager:
 
     def get_language(self):
         """获取当前UI语言设置"""
-        with self.lock:
-            return self.settings.get('ui', {}).get('language', 'en')
+        return self.snapshot.settings.get('ui', {}).get('language', 'en')
 
     def set_language(self, language):
         """设置UI语言"""
-        with self.lock:
-            if 'ui' not in self.settings:
-                self.settings['ui'] = {}
-            self.settings['ui']['language'] = language
-            # 立即保存到文件
-            try:
-                with open(self.config_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.settings, f, indent=4, ensure_ascii=False)
-                print(f"成功保存语言设置: {language}")
-                return True
-            except IOError as e:
-                print(f"保存语言设置失败: {e}")
-                return False
+        def mutate(settings):
+            settings.setdefault('ui', {})['language'] = language
+
+        # 立即保存到文件
+        try:
+            self._update_settings(mutate)
+            print(f"成功保存语言设置: {language}")
+        except IOError as e:
+            print(f"保存语言设置失败: {e}")
+            return False
+        # 日志使用的语言随之切换
+        from .log_manager import log_manager
+        log_manager.set_locale(language)
+        return True
 
     def _needs_migration(self, settings):
         """检查配置是否是需要迁移的旧格式（基于字典）"""
@@ -189,72 +422,60 @@ class ConfigManager:
 
     def is_auth_required(self):
         """检查是否需要认证"""
-        with self.lock:
-            auth_config = self.settings.get('auth', {})
-            return auth_config.get('require_auth', False)
+        auth_config = self.snapshot.settings.get('auth', {})
+        return auth_config.get('require_auth', False)
 
     def has_auth_configured(self):
         """检查是否已配置认证"""
-        with self.lock:
-            auth_config = self.settings.get('auth', {})
-            return (auth_config.get('username') is not None and 
-                    auth_config.get('password_hash') is not None)
+        auth_config = self.snapshot.settings.get('auth', {})
+        return (auth_config.get('username') is not None and 
+                auth_config.get('password_hash') is not None)
 
     def is_legacy_install(self):
         """检查是否是旧版本安装（无认证配置）"""
-        with self.lock:
-            if 'auth' not in self.settings:
-                return True
-            # 直接检查，避免重入锁
-            auth_config = self.settings.get('auth', {})
-            has_configured = (auth_config.get('username') is not None and 
-                            auth_config.get('password_hash') is not None)
-            return not has_configured
+        if 'auth' not in self.snapshot.settings:
+            return True
+        return not self.has_auth_configured()
 
     def verify_password(self, username, password):
         """验证用户名和密码"""
-        with self.lock:
-            auth_config = self.settings.get('auth', {})
-            stored_username = auth_config.get('username')
-            stored_password_hash = auth_config.get('password_hash')
-            
-            if not stored_username or not stored_password_hash:
-                return False
-            
-            if username != stored_username:
-                return False
-            
-            try:
-                return bcrypt.checkpw(password.encode('utf-8'), stored_password_hash.encode('utf-8'))
-            except Exception:
-                return False
+        auth_config = self.snapshot.settings.get('auth', {})
+        stored_username = auth_config.get('username')
+        stored_password_hash = auth_config.get('password_hash')
+        
+        if not stored_username or not stored_password_hash:
+            return False
+        
+        if username != stored_username:
+            return False
+        
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), stored_password_hash.encode('utf-8'))
+        except Exception:
+            return False
 
     def set_auth_credentials(self, username, password):
         """设置认证凭据"""
-        with self.lock:
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-            
-            if 'auth' not in self.settings:
-                self.settings['auth'] = {}
-            
-            self.settings['auth']['username'] = username
-            self.settings['auth']['password_hash'] = password_hash.decode('utf-8')
-            self.settings['auth']['require_auth'] = True
-            
-            # 立即保存到文件
-            try:
-                with open(self.config_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.settings, f, indent=4, ensure_ascii=False)
-                print(f"成功保存认证设置")
-                return True
-            except IOError as e:
-                print(f"保存认证设置失败: {e}")
-                return False
+        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+
+        def mutate(settings):
+            auth_config = settings.setdefault('auth', {})
+            auth_config['username'] = username
+            auth_config['password_hash'] = password_hash.decode('utf-8')
+            auth_config['require_auth'] = True
+
+        # 立即保存到文件
+        try:
+            self._update_settings(mutate)
+            print(f"成功保存认证设置")
+            return True
+        except IOError as e:
+            print(f"保存认证设置失败: {e}")
+            return False
 
     def get_auth_username(self):
         """获取认证用户名"""
-        with self.lock:
-            auth_config = self.settings.get('auth', {})
-            return auth_config.get('username')
+        auth_config = self.snapshot.settings.get('auth', {})
+        return auth_config.get('username')
 
 config_manager = ConfigManager() 
\ No newline at end of file
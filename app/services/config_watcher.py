@@ -0,0 +1,160 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from threading import Thread, Event
+from .config_manager import config_manager
+from .log_manager import log_manager, N_
+from .scheduler import scheduler
+
+class InotifyWatch:
+    """
+    通过 ctypes 调用 Linux inotify 监视一个目录。
+    监视目录而不是文件本身，这样编辑器或配置管理工具用 rename 原子替换文件后仍能收到事件。
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, directory):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("找不到libc")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("当前系统不支持inotify")
+
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch 失败")
+
+    def wait(self, timeout):
+        """
+        等待目录中的文件变化。
+        :return: 发生变化的文件名集合，超时返回空集合
+        """
+        readable, _w, _x = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names = set()
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _wd, _mask, _cookie, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            names.add(os.fsdecode(data[offset:offset + name_length].rstrip(b'\0')))
+            offset += name_length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+class ConfigWatcher:
+    """
+    监视 config.json 的外部修改并热加载。
+    优先使用 inotify，不可用时（非Linux、监视数量超限等）退回按修改时间轮询。
+    文件变化后稍作等待以合并连续的写入，随后校验并发布新快照，再增量应用到调度器和日志，
+    不需要重启进程，未受影响实例的限速状态保持不变。校验失败时继续使用当前配置。
+    """
+    def __init__(self, poll_interval=2.0, settle_delay=0.3):
+        self.poll_interval = poll_interval  # 轮询模式下检查文件修改时间的间隔（秒）
+        self.settle_delay = settle_delay  # 收到变化后等待写入完成的时间（秒）
+        self.thread = None
+        self.stopping = Event()
+        self.mode = None  # 'inotify' 或 'polling'
+        self.last_error = None  # 上一次校验失败的原因，相同的错误只记录一次
+
+    def start(self, app):
+        """启动后台监视线程（重复调用无副作用）"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.app = app
+        self.stopping.clear()
+        self.thread = Thread(target=self._run, name='auto-limit-config-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _run(self):
+        config_path = config_manager.config_path
+        file_name = os.path.basename(config_path)
+        try:
+            watch = InotifyWatch(os.path.dirname(config_path))
+        except (OSError, AttributeError) as e:
+            self.app.logger.info(f"inotify不可用，改为轮询配置文件: {e}")
+            self.mode = 'polling'
+            self._run_polling(config_path)
+            return
+
+        self.mode = 'inotify'
+        try:
+            while not self.stopping.is_set():
+                if file_name not in watch.wait(1.0):
+                    continue
+                # 合并同一次保存产生的多个事件
+                while file_name in watch.wait(self.settle_delay):
+                    pass
+                self._reload()
+        finally:
+            watch.close()
+
+    def _run_polling(self, config_path):
+        last_signature = self._signature(config_path)
+        while not self.stopping.wait(self.poll_interval):
+            signature = self._signature(config_path)
+            if signature == last_signature:
+                continue
+            last_signature = signature
+            if self.stopping.wait(self.settle_delay):
+                break
+            self._reload()
+
+    def _signature(self, config_path):
+        """文件的修改时间、大小和inode，任何一项变化都视为文件被修改"""
+        try:
+            stat = os.stat(config_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _reload(self):
+        """重新加载配置文件，内容有变化时增量应用"""
+        with self.app.app_context():
+            try:
+                changed = config_manager.reload_settings()
+            except FileNotFoundError:
+                return
+            except (ValueError, OSError) as e:
+                if str(e) != self.last_error:
+                    self.last_error = str(e)
+                    log_manager.log_formatted_event("CONFIG_ERROR", N_("配置文件校验失败，继续使用当前配置: {0}"), str(e))
+                return
+            self.last_error = None
+            if not changed:
+                return
+
+            settings = config_manager.get_settings()
+            log_manager.configure(settings.get('logging', {}))
+            log_manager.set_locale(settings.get('ui', {}).get('language'))
+            log_manager.log_event("CONFIG", N_("检测到配置文件被外部修改，已重新加载"))
+            scheduler.reconfigure()
+
+config_watcher = ConfigWatcher()
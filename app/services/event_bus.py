@@ -0,0 +1,64 @@
+import queue
+from threading import Lock
+
+class Subscription:
+    """
+    单个订阅者（例如一个SSE连接）的事件队列。
+    队列有上限，消费过慢的订阅者会丢弃最旧的事件，而不会阻塞发布者。
+    """
+    def __init__(self, channels, max_queue=100):
+        self.channels = set(channels)
+        self.queue = queue.Queue(maxsize=max_queue)
+
+    def put(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        取出下一个事件。
+        :return: (channel, data)，超时返回 None
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBus:
+    """
+    进程内的发布/订阅总线，调度器和日志管理器通过它把状态变化推送给SSE连接。
+    发布是非阻塞的，没有订阅者时几乎没有开销。
+    """
+    CHANNELS = ('dashboard', 'logs')
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = Lock()
+
+    def subscribe(self, channels=None):
+        subscription = Subscription(channels or self.CHANNELS)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, channel, data):
+        """向订阅了该频道的所有订阅者发布事件"""
+        with self.lock:
+            if not self.subscriptions:
+                return
+            targets = [s for s in self.subscriptions if channel in s.channels]
+        for subscription in targets:
+            subscription.put((channel, data))
+
+event_bus = EventBus()
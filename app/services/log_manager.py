@@ -1,57 +1,283 @@
-import json
+import atexit
+import itertools
+import logging
 import os
-import shutil
-import tempfile
+import sqlite3
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from threading import RLock
+from threading import Condition, Lock, RLock, Thread
+from time import monotonic
 from flask import current_app, has_request_context, has_app_context
-from flask_babel import gettext as _, force_locale
+from flask_babel import force_locale, get_locale, get_translations
+from .event_bus import event_bus
+from .log_store import SegmentedLogStore, SqliteLogStore
+
+def N_(message):
+    """
+    标记日志模板供 pybabel 提取（-k N_），原样返回msgid。
+    日志只保存msgid和参数，翻译推迟到读取时按查看者的语言进行。
+    """
+    return message
+
+# 当前线程正在调用的插件实例ID，用于按来源限流
+_current_source = ContextVar('log_source', default=None)
+
+class TokenBucket:
+    """令牌桶：容量为 capacity，每秒补充 rate 个令牌"""
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = monotonic()
+
+    def is_full(self):
+        """令牌是否已补满（长时间未使用的桶可以丢弃）"""
+        return self.tokens + (monotonic() - self.updated_at) * self.rate >= self.capacity
+
+    def consume(self):
+        """尝试取出一个令牌，成功返回 True"""
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
 
 class LogManager:
     """
-    管理JSON格式的日志文件。
-    使用原子写入和优化的锁机制来防止并发写入时的数据损坏。
+    管理日志的记录和读取。
+    最近的日志保存在内存环形缓冲区中，get_logs 直接从内存返回；
+    新日志由后台写入线程按条数或时间攒批落盘，调用方不再等待磁盘IO。
+    存储可选分段的JSONL文件（默认）或带索引的SQLite数据库。
+    时间窗口内重复的相同事件合并为一条并累计次数，每个来源（事件类型加产生日志的实例）还有独立的令牌桶限流，
+    故障期间的日志量和磁盘写入保持有界。
     """
+    DURABILITY_MODES = ('async', 'batch', 'sync')
+    BACKENDS = ('jsonl', 'sqlite')
+
     def __init__(self, max_entries=500):
-        self.log_path = None
+        self.log_dir = None
+        self.store = None
         self.max_entries = max_entries
+        self.backend = 'jsonl'
+        self.retention_days = 90
+        self.retention_bytes = 50 * 1024 * 1024
+        self.segment_max_bytes = 1024 * 1024
+        self.segment_max_age = 86400
+        self.durability = 'batch'
+        self.flush_interval = 1.0
+        self.flush_batch_size = 100
+        self.coalesce_window = 300
+        self.rate_limit_burst = 30
+        self.rate_limit_per_minute = 20
+        self.buffer = deque(maxlen=max_entries)  # 从新到旧
+        self.pending = []  # 等待写入磁盘的日志（从旧到新）
+        self.pending_ids = set()  # 已在待写队列中的日志ID，合并更新的条目不重复入队
+        self.recent_events = {}  # {事件键: (entry, first_seen)}，按首次出现排序，用于合并窗口内重复的事件
+        self.rate_limiters = {}  # {来源: TokenBucket}
+        self.suppressed = {}  # {来源: 被限流丢弃的条数}
+        self.writer_thread = None
+        self._ids = itertools.count(1)  # 日志ID，单调递增，用作分页游标
         self._app = None  # 存储应用实例的引用
-        self._lock = RLock()  # 线程安全锁
-        self._write_lock = RLock()  # 专门用于文件写入的锁
+        self._lock = RLock()  # 保护内存缓冲区
+        self._pending_condition = Condition()
+        self._flush_lock = Lock()  # 保证批次按顺序写入
+        self._locale = None  # 后台线程使用的日志语言，由 set_locale 更新
+        self._catalogs = {}  # {locale: Translations}
+        self._translation_cache = {}  # {(locale, message): translated}
+        self._translation_lock = Lock()
 
     def init_app(self, app):
         """用Flask app实例来初始化"""
-        self.log_path = os.path.join(app.config['DATA_DIR'], 'logs.json')
+        from .config_manager import config_manager
+
+        self.log_dir = os.path.join(app.config['DATA_DIR'], 'logs')
         self._app = app
+        self.configure(config_manager.get_settings().get('logging', {}))
+        self.store = self._create_store(app.config['DATA_DIR'])
+
+        try:
+            recent_logs = self.store.read(self.max_entries)
+            last_id = self.store.last_id()
+        except IOError as e:
+            self._safe_log_error(f"读取日志文件失败: {e}")
+            recent_logs = []
+            last_id = 0
+        with self._lock:
+            self.buffer = deque(recent_logs, maxlen=self.max_entries)
+            self._ids = itertools.count(last_id + 1)
+
+        # 进程退出前写出尚未落盘的日志
+        atexit.register(self.flush)
+
+    def _create_store(self, data_dir):
+        """根据配置创建日志存储，必要时迁移旧格式的日志"""
+        segmented_store = SegmentedLogStore(
+            self.log_dir,
+            segment_max_bytes=self.segment_max_bytes,
+            segment_max_age=self.segment_max_age,
+            retention_bytes=self.retention_bytes,
+            retention_days=self.retention_days,
+            on_error=self._safe_log_error
+        )
+        # 迁移旧版的 logs.json
+        segmented_store.migrate_from_json(os.path.join(data_dir, 'logs.json'))
+        if self.backend != 'sqlite':
+            return segmented_store
+
+        try:
+            sqlite_store = SqliteLogStore(
+                os.path.join(data_dir, 'logs.db'),
+                retention_days=self.retention_days,
+                on_error=self._safe_log_error
+            )
+            # 首次切换到SQLite时导入段存储中的日志
+            sqlite_store.import_entries(list(reversed(segmented_store.read(self.max_entries))))
+            return sqlite_store
+        except (sqlite3.Error, IOError) as e:
+            self._safe_log_error(f"打开SQLite日志数据库失败，回退到JSONL存储: {e}")
+            return segmented_store
+
+    def configure(self, logging_settings):
+        """应用日志配置（保留条数、落盘策略、攒批参数）"""
+        # 存储类型和保留策略只在初始化时生效
+        if self.store is None:
+            if logging_settings.get('backend') in self.BACKENDS:
+                self.backend = logging_settings['backend']
+            self.retention_days = logging_settings.get('retention_days', self.retention_days)
+            self.retention_bytes = logging_settings.get('retention_bytes', self.retention_bytes)
+            self.segment_max_bytes = logging_settings.get('segment_max_bytes', self.segment_max_bytes)
+            self.segment_max_age = logging_settings.get('segment_max_age', self.segment_max_age)
+        durability = logging_settings.get('durability', self.durability)
+        if durability in self.DURABILITY_MODES:
+            self.durability = durability
+        self.flush_interval = max(float(logging_settings.get('flush_interval', self.flush_interval)), 0.05)
+        self.flush_batch_size = max(int(logging_settings.get('flush_batch_size', self.flush_batch_size)), 1)
+
+        self.coalesce_window = max(float(logging_settings.get('coalesce_window', self.coalesce_window)), 0)
+        rate_limit_burst = max(int(logging_settings.get('rate_limit_burst', self.rate_limit_burst)), 0)
+        rate_limit_per_minute = max(float(logging_settings.get('rate_limit_per_minute', self.rate_limit_per_minute)), 0)
+        if (rate_limit_burst, rate_limit_per_minute) != (self.rate_limit_burst, self.rate_limit_per_minute):
+            with self._lock:
+                self.rate_limit_burst = rate_limit_burst
+                self.rate_limit_per_minute = rate_limit_per_minute
+                self.rate_limiters.clear()
+
+        max_entries = max(int(logging_settings.get('max_entries', self.max_entries)), 1)
+        if max_entries != self.max_entries:
+            with self._lock:
+                self.max_entries = max_entries
+                self.buffer = deque(self.buffer, maxlen=max_entries)
 
     def get_logs(self):
-        """从JSON文件安全地加载日志"""
-        if self.log_path is None:
+        """从内存缓冲区返回最近的日志（已渲染为当前语言），按时间从新到旧"""
+        if self.store is None:
             raise RuntimeError("LogManager has not been initialized. Call init_app(app) first.")
         
         with self._lock:
+            entries = list(self.buffer)
+        return [self.render_entry(entry) for entry in entries]
+
+    def query_logs(self, before_id=None, types=None, limit=50):
+        """
+        按游标分页查询日志（已渲染为当前语言），按时间从新到旧。
+        SQLite存储直接走索引查询，JSONL存储从内存缓冲区过滤。
+        :param before_id: 上一页返回的游标，只返回ID更小的日志
+        :param types: 事件类型列表，为空时不过滤
+        :return: (entries, next_cursor)，没有更多日志时 next_cursor 为 None
+        """
+        if self.store is None:
+            raise RuntimeError("LogManager has not been initialized. Call init_app(app) first.")
+
+        if isinstance(self.store, SqliteLogStore):
+            # 先写出待写日志，保证查询结果包含最新的记录
+            self.flush()
+            entries = self.store.query(before_id=before_id, types=types, limit=limit + 1)
+        else:
+            type_set = set(types or [])
+            entries = []
+            with self._lock:
+                for entry in self.buffer:
+                    if before_id is not None and entry.get('id', 0) >= before_id:
+                        continue
+                    if type_set and entry.get('type') not in type_set:
+                        continue
+                    entries.append(entry)
+                    if len(entries) > limit:
+                        break
+
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = entries[-1].get('id')
+        return [self.render_entry(entry) for entry in entries], next_cursor
+
+    def iter_export(self):
+        """
+        按时间从旧到新逐条产出所有历史日志（已渲染为当前语言），用于流式导出。
+        每个ID只产出一次，内容为其最新状态；逐段读取，不会把全部历史加载到内存。
+        """
+        if self.store is None:
+            raise RuntimeError("LogManager has not been initialized. Call init_app(app) first.")
+        self.flush()
+        for entry in self.store.iter_entries():
+            yield self.render_entry(entry)
+
+    def get_log_types(self):
+        """返回已记录过的事件类型，用于日志页面的过滤"""
+        if isinstance(self.store, SqliteLogStore):
+            return self.store.get_types()
+        with self._lock:
+            return sorted({entry.get('type') for entry in self.buffer if entry.get('type')})
+
+    def flush(self):
+        """把等待中的日志写入磁盘"""
+        if self.store is None:
+            return
+        with self._flush_lock:
+            with self._pending_condition:
+                batch = self.pending
+                self.pending = []
+                self.pending_ids = set()
+            if not batch:
+                return
+            # 合并中的条目可能被其他线程更新，写入的是此刻的副本
+            with self._lock:
+                batch = [dict(entry) for entry in batch]
             try:
-                if os.path.exists(self.log_path):
-                    with open(self.log_path, 'r', encoding='utf-8') as f:
-                        return json.load(f)
-            except UnicodeDecodeError as e:
-                self._safe_log_error(f"日志文件编码错误: {e}")
-                # 尝试恢复日志文件
-                recovered_logs = self._try_recover_logs()
-                if recovered_logs is not None:
-                    # 如果恢复成功，重新写入文件
-                    self._backup_corrupted_log_file()
-                    self._atomic_write_logs(recovered_logs)
-                    return recovered_logs
-                else:
-                    # 恢复失败，备份并重新创建
-                    self._backup_corrupted_log_file()
-                    self._create_new_log_file()
-            except (json.JSONDecodeError, IOError) as e:
-                self._safe_log_error(f"读取日志文件失败: {e}")
-                # 如果日志文件损坏，创建新的日志文件
-                self._create_new_log_file()
-            return []
+                self.store.append(batch, fsync=self.durability != 'async')
+            except IOError as e:
+                self._safe_log_error(f"保存日志文件失败: {e}")
+
+    def _enqueue(self, log_entry):
+        """把日志放入待写队列，并确保后台写入线程在运行"""
+        with self._pending_condition:
+            if log_entry['id'] in self.pending_ids:
+                return
+            self.pending.append(log_entry)
+            self.pending_ids.add(log_entry['id'])
+            if self.writer_thread is None or not self.writer_thread.is_alive():
+                self.writer_thread = Thread(target=self._run_writer, name='auto-limit-log-writer', daemon=True)
+                self.writer_thread.start()
+            if len(self.pending) >= self.flush_batch_size:
+                self._pending_condition.notify()
+
+    def _run_writer(self):
+        """后台写入线程：攒够 flush_batch_size 条或等待 flush_interval 秒后写入一批"""
+        while True:
+            with self._pending_condition:
+                while not self.pending:
+                    self._pending_condition.wait()
+                deadline = monotonic() + self.flush_interval
+                while len(self.pending) < self.flush_batch_size:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_condition.wait(remaining)
+            self.flush()
 
     def _safe_log_error(self, message):
         """安全地记录错误日志"""
@@ -71,306 +297,218 @@ class LogManager:
         else:
             print(f"INFO: {message}")
 
-    def _try_recover_logs(self):
-        """尝试从损坏的日志文件中恢复数据"""
-        try:
-            if not os.path.exists(self.log_path):
-                return None
-            
-            # 尝试用不同的编码读取文件
-            encodings = ['utf-8', 'utf-8-sig', 'latin1', 'cp1252']
-            content = None
-            
-            for encoding in encodings:
-                try:
-                    with open(self.log_path, 'r', encoding=encoding, errors='replace') as f:
-                        content = f.read()
-                    break
-                except:
-                    continue
-            
-            if content is None:
-                return None
-            
-            # 尝试修复JSON格式
-            try:
-                # 首先尝试直接解析
-                return json.loads(content)
-            except json.JSONDecodeError:
-                # 如果失败，尝试找到最后一个完整的日志条目
-                try:
-                    # 查找最后一个完整的 '}]' 结构
-                    last_bracket = content.rfind('}]')
-                    if last_bracket > 0:
-                        truncated_content = content[:last_bracket + 2]
-                        return json.loads(truncated_content)
-                except:
-                    pass
-                
-                # 尝试逐行解析，构建有效的日志条目
-                try:
-                    lines = content.split('\n')
-                    valid_logs = []
-                    current_entry = ""
-                    brace_count = 0
-                    
-                    for line in lines:
-                        current_entry += line
-                        brace_count += line.count('{') - line.count('}')
-                        
-                        # 如果大括号平衡，尝试解析当前条目
-                        if brace_count == 0 and current_entry.strip():
-                            try:
-                                # 移除可能的逗号和括号
-                                entry_text = current_entry.strip().rstrip(',').strip('[]')
-                                if entry_text:
-                                    entry = json.loads(entry_text)
-                                    if isinstance(entry, dict) and 'timestamp' in entry:
-                                        valid_logs.append(entry)
-                            except:
-                                pass
-                            current_entry = ""
-                    
-                    return valid_logs if valid_logs else []
-                except:
-                    pass
-                
-                # 如果所有修复尝试都失败，返回空列表
-                return []
-        
-        except Exception as e:
-            self._safe_log_error(f"恢复日志文件失败: {e}")
-            return None
+    def _get_locale(self):
+        """
+        当前用于翻译日志的语言。
+        请求中使用请求的语言；后台线程使用缓存的UI语言，不再每次读取配置。
+        """
+        if has_request_context():
+            return str(get_locale())
+        if self._locale is None:
+            from .config_manager import config_manager
+            self._locale = self._normalize_locale(config_manager.get_language())
+        return self._locale
 
-    def _backup_corrupted_log_file(self):
-        """备份损坏的日志文件"""
-        try:
-            if os.path.exists(self.log_path):
-                backup_path = f"{self.log_path}.corrupted.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                shutil.move(self.log_path, backup_path)
-                self._safe_log_info(f"已备份损坏的日志文件到: {backup_path}")
-        except Exception as e:
-            self._safe_log_error(f"备份损坏日志文件失败: {e}")
+    def _normalize_locale(self, language):
+        languages = self._app.config.get('LANGUAGES', ['zh', 'en']) if self._app else ['zh', 'en']
+        if language in languages:
+            return language
+        return self._app.config.get('BABEL_DEFAULT_LOCALE', 'zh') if self._app else 'zh'
 
-    def _create_new_log_file(self):
-        """创建新的日志文件"""
-        try:
-            initial_log = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],  # 毫秒精度
-                "type": "SYSTEM",
-                "message": "日志系统已重新初始化"
-            }
-            self._atomic_write_logs([initial_log])
-        except Exception as e:
-            self._safe_log_error(f"创建新日志文件失败: {e}")
-
-    def _atomic_write_logs(self, logs):
-        """使用原子操作写入日志文件"""
-        if not logs:
-            return False
-            
-        with self._write_lock:
-            try:
-                # 确保所有日志条目都是有效的UTF-8字符串
-                cleaned_logs = []
-                for log in logs:
-                    cleaned_log = {}
-                    for key, value in log.items():
-                        if isinstance(value, str):
-                            # 清理无效的UTF-8字符
-                            try:
-                                cleaned_log[key] = value.encode('utf-8', errors='replace').decode('utf-8')
-                            except:
-                                cleaned_log[key] = str(value)
-                        else:
-                            cleaned_log[key] = value
-                    cleaned_logs.append(cleaned_log)
-                
-                # 获取日志文件所在目录
-                log_dir = os.path.dirname(self.log_path)
-                
-                # 创建临时文件在同一目录下
-                with tempfile.NamedTemporaryFile(
-                    mode='w', 
-                    encoding='utf-8', 
-                    dir=log_dir,
-                    suffix='.tmp',
-                    prefix='logs_',
-                    delete=False
-                ) as temp_file:
-                    temp_path = temp_file.name
-                    # 使用紧凑JSON格式减少写入时间
-                    json.dump(cleaned_logs, temp_file, ensure_ascii=False, separators=(',', ':'))
-                    temp_file.flush()
-                    os.fsync(temp_file.fileno())  # 强制写入磁盘
-                
-                # 原子替换：在Unix系统上rename是原子操作
-                os.rename(temp_path, self.log_path)
-                return True
-                
-            except Exception as e:
-                # 清理临时文件
-                try:
-                    if 'temp_path' in locals() and os.path.exists(temp_path):
-                        os.unlink(temp_path)
-                except:
-                    pass
-                
-                self._safe_log_error(f"原子写入日志文件失败: {e}")
-                
-                # 回退到直接写入
-                try:
-                    with open(self.log_path, 'w', encoding='utf-8') as f:
-                        json.dump(cleaned_logs, f, ensure_ascii=False, separators=(',', ':'))
-                    return True
-                except Exception as fallback_e:
-                    self._safe_log_error(f"回退写入日志文件也失败: {fallback_e}")
-                    return False
-
-    # 保持向后兼容
-    def _write_logs(self, logs):
-        """向后兼容的写入方法"""
-        return self._atomic_write_logs(logs)
-
-    def _translate(self, message):
+    def set_locale(self, language):
+        """UI语言变化时调用：更新后台线程使用的语言并清空翻译缓存"""
+        with self._translation_lock:
+            self._locale = self._normalize_locale(language)
+            self._catalogs.clear()
+            self._translation_cache.clear()
+
+    def _get_catalog(self, locale):
+        """获取指定语言的翻译目录，每种语言只加载一次"""
+        catalog = self._catalogs.get(locale)
+        if catalog is None:
+            with self._translation_lock:
+                catalog = self._catalogs.get(locale)
+                if catalog is None:
+                    with self._app.app_context(), force_locale(locale):
+                        catalog = get_translations()
+                    self._catalogs[locale] = catalog
+        return catalog
+
+    def _translate(self, message, locale=None):
         """
         翻译消息。
-        对于后台任务，它会创建一个临时的请求上下文。
+        按 (语言, 消息) 缓存翻译结果，命中时只需一次字典查找。
         """
+        if self._app is None:
+            return message
+        locale = locale or self._get_locale()
+        key = (locale, message)
+        translated = self._translation_cache.get(key)
+        if translated is not None:
+            return translated
         try:
-            # 如果有请求上下文，直接使用标准的翻译函数
-            if has_request_context():
-                return _(message)
-            
-            # 如果没有请求上下文（例如在后台线程中），但有应用上下文
-            if self._app and has_app_context():
-                # 获取配置的语言设置
-                from .config_manager import config_manager
-                try:
-                    config_language = config_manager.get_language()
-                    if config_language in self._app.config.get('LANGUAGES', ['zh', 'en']):
-                        # 使用 force_locale 强制设置语言环境
-                        with force_locale(config_language):
-                            return _(message)
-                except:
-                    pass
-                
-                # 如果获取语言失败，使用默认语言
-                with self._app.test_request_context():
-                    return _(message)
+            translated = self._get_catalog(locale).gettext(message)
         except Exception as e:
             # 如果翻译因任何原因失败，返回原始消息
             self._safe_log_error(f"翻译日志消息失败: {e}")
             return message
-        
-        # 如果以上条件都不满足，返回原始消息
-        return message
+        self._translation_cache[key] = translated
+        return translated
+
+    @contextmanager
+    def source(self, instance_id):
+        """
+        在代码块内把日志来源标记为指定的插件实例，块内记录的日志按 (事件类型, 实例) 分别限流。
+        不在任何块内的日志按事件类型限流。
+        """
+        token = _current_source.set(instance_id)
+        try:
+            yield
+        finally:
+            _current_source.reset(token)
 
     def log_event(self, event_type, message):
-        """记录事件到JSON日志文件"""
-        if self.log_path is None:
+        """记录事件到日志文件"""
+        self.log_formatted_event(event_type, message)
+
+    def log_formatted_event(self, event_type, message_template, *args, **kwargs):
+        """
+        记录格式化的日志事件。
+        只保存模板的原文（msgid）和参数，翻译和格式化推迟到读取时按查看者的语言进行。
+        模板应使用 N_ 标记，已翻译的字符串也能正常记录，只是不会随语言切换。
+        """
+        if self.store is None:
             raise RuntimeError("LogManager has not been initialized. Call init_app(app) first.")
 
         try:
-            # 清理输入的消息，确保是有效的UTF-8字符串
-            if isinstance(message, str):
-                message = message.encode('utf-8', errors='replace').decode('utf-8')
-            else:
-                message = str(message)
-            
-            if isinstance(event_type, str):
-                event_type = event_type.encode('utf-8', errors='replace').decode('utf-8')
-            else:
-                event_type = str(event_type)
-        except:
+            template = self._clean_text(message_template)
+            event_type = self._clean_text(event_type)
+            args = [self._serialize_arg(arg) for arg in args]
+            kwargs = {key: self._serialize_arg(value) for key, value in kwargs.items()}
+        except Exception:
             # 如果清理失败，使用安全的默认值
-            message = "日志消息包含无效字符"
+            template = "日志消息包含无效字符"
             event_type = "SYSTEM"
+            args = []
+            kwargs = {}
 
-        translated_message = self._translate(message)
-        self._safe_log_info(f"[{event_type}] {translated_message}")
-        
-        with self._lock:
-            # 避免嵌套锁调用，直接读取日志
-            try:
-                if os.path.exists(self.log_path):
-                    with open(self.log_path, 'r', encoding='utf-8') as f:
-                        logs = json.load(f)
-                else:
-                    logs = []
-            except (json.JSONDecodeError, IOError, UnicodeDecodeError):
-                # 如果读取失败，从恢复机制获取日志
-                logs = self.get_logs()
-            
-            log_entry = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],  # 毫秒精度
-                "type": event_type,
-                "message": translated_message
-            }
-            logs.insert(0, log_entry)
-            
-            trimmed_logs = logs[:self.max_entries]
-            
-            # 使用原子写入
-            if not self._atomic_write_logs(trimmed_logs):
-                self._safe_log_error(f"保存日志文件失败")
+        self._append_entry(event_type, template, args, kwargs)
 
-    def log_formatted_event(self, event_type, message_template, *args, **kwargs):
-        """记录格式化的日志事件"""
-        if self.log_path is None:
-            raise RuntimeError("LogManager has not been initialized. Call init_app(app) first.")
+    def _clean_text(self, value):
+        """确保是有效的UTF-8字符串"""
+        if not isinstance(value, str):
+            value = str(value)
+        return value.encode('utf-8', errors='replace').decode('utf-8')
+
+    def _serialize_arg(self, value):
+        """把参数转换为可JSON序列化的值，保留数字以支持 {0:.2f} 之类的格式"""
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        return self._clean_text(value)
 
+    def render_entry(self, entry, locale=None):
+        """
+        把存储的日志条目渲染为指定语言（默认当前查看者的语言）的消息。
+        旧格式的条目已包含渲染好的 message，原样返回。
+        """
+        if 'template' not in entry:
+            return entry
+        template = entry['template']
+        args = entry.get('args', [])
+        kwargs = entry.get('kwargs', {})
         try:
-            translated_template = self._translate(message_template)
-            formatted_message = translated_template.format(*args, **kwargs)
-        except:
+            message = self._translate(template, locale).format(*args, **kwargs)
+        except Exception:
             try:
-                formatted_message = message_template.format(*args, **kwargs)
-            except:
-                formatted_message = message_template
+                message = template.format(*args, **kwargs)
+            except Exception:
+                message = template
+        rendered = {key: value for key, value in entry.items() if key not in ('template', 'args', 'kwargs')}
+        rendered['message'] = message
+        return rendered
 
-        try:
-            # 清理输入的消息，确保是有效的UTF-8字符串
-            if isinstance(formatted_message, str):
-                formatted_message = formatted_message.encode('utf-8', errors='replace').decode('utf-8')
-            else:
-                formatted_message = str(formatted_message)
-            
-            if isinstance(event_type, str):
-                event_type = event_type.encode('utf-8', errors='replace').decode('utf-8')
-            else:
-                event_type = str(event_type)
-        except:
-            # 如果清理失败，使用安全的默认值
-            formatted_message = "日志消息包含无效字符"
-            event_type = "SYSTEM"
+    def _append_entry(self, event_type, template, args, kwargs):
+        """
+        记录一条日志到内存缓冲区并安排落盘，然后推送给SSE订阅者。
+        类型、模板和参数都相同、且距其首次出现不超过合并窗口的事件，只更新该条目的次数和最后出现时间，
+        条目保留在首次出现的位置（ID和分页游标不变），页面通过最后出现时间显示其仍在发生。
+        新条目需要通过其来源（事件类型加产生日志的实例，见 source()）的令牌桶，一个实例刷屏不会挤掉其他实例的日志。
+        """
+        key = (event_type, template, tuple(args), tuple(sorted(kwargs.items())))
+        source = (event_type, _current_source.get())
+        now = monotonic()
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]  # 毫秒精度
+        suppressed_count = 0
 
-        self._safe_log_info(f"[{event_type}] {formatted_message}")
-        
         with self._lock:
-            # 避免嵌套锁调用，直接读取日志
-            try:
-                if os.path.exists(self.log_path):
-                    with open(self.log_path, 'r', encoding='utf-8') as f:
-                        logs = json.load(f)
-                else:
-                    logs = []
-            except (json.JSONDecodeError, IOError, UnicodeDecodeError):
-                # 如果读取失败，从恢复机制获取日志
-                logs = self.get_logs()
-            
-            log_entry = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],  # 毫秒精度
-                "type": event_type,
-                "message": formatted_message
-            }
-            
-            logs.insert(0, log_entry)
-            
-            trimmed_logs = logs[:self.max_entries]
-            
-            # 使用原子写入
-            if not self._atomic_write_logs(trimmed_logs):
-                self._safe_log_error(f"保存日志文件失败")
+            self._expire_recent_events(now)
+            recent = self.recent_events.get(key)
+            if recent and self._in_buffer(recent[0]):
+                log_entry = recent[0]
+                log_entry["count"] = log_entry.get("count", 1) + 1
+                log_entry["last_seen"] = timestamp
+                is_new = False
+            else:
+                if not self._acquire_token(source):
+                    self.suppressed[source] = self.suppressed.get(source, 0) + 1
+                    return
+                suppressed_count = self.suppressed.pop(source, 0)
+                log_entry = {
+                    "id": next(self._ids),
+                    "timestamp": timestamp,
+                    "type": event_type,
+                    "template": template
+                }
+                if args:
+                    log_entry["args"] = args
+                if kwargs:
+                    log_entry["kwargs"] = kwargs
+                self.buffer.appendleft(log_entry)
+                self.recent_events.pop(key, None)
+                self.recent_events[key] = (log_entry, now)
+                is_new = True
+
+        if suppressed_count:
+            # 限流解除后记录一条被丢弃的条数
+            self.log_formatted_event("SYSTEM", N_("{0} 类型的日志过于频繁，已丢弃 {1} 条"), event_type, suppressed_count)
+
+        self._enqueue(log_entry)
+        if self.durability == 'sync':
+            self.flush()
+
+        if is_new:
+            logger = self._app.logger if self._app else None
+            if logger is None or logger.isEnabledFor(logging.INFO):
+                self._safe_log_info(f"[{event_type}] {self.render_entry(log_entry)['message']}")
+
+        # 推送给订阅了日志的SSE连接（合并更新的条目ID不变，页面据此原地更新）
+        event_bus.publish('logs', dict(log_entry))
+
+    def _expire_recent_events(self, now):
+        """丢弃超出合并窗口的事件键（按首次出现排序，从最旧的开始检查）"""
+        while self.recent_events:
+            key, (_entry, first_seen) = next(iter(self.recent_events.items()))
+            if now - first_seen <= self.coalesce_window:
+                break
+            del self.recent_events[key]
+
+    def _acquire_token(self, source):
+        """从来源对应的令牌桶中取令牌，未启用限流时总是成功"""
+        if not self.rate_limit_burst or not self.rate_limit_per_minute:
+            return True
+        bucket = self.rate_limiters.get(source)
+        if bucket is None:
+            # 新来源出现时顺便丢弃已补满的桶，桶的数量只取决于近期活跃的来源
+            for idle_source in [key for key, idle in self.rate_limiters.items() if idle.is_full()]:
+                del self.rate_limiters[idle_source]
+            bucket = self.rate_limiters[source] = TokenBucket(self.rate_limit_burst, self.rate_limit_per_minute / 60)
+        return bucket.consume()
+
+    def _in_buffer(self, log_entry):
+        """
+        条目是否仍在内存缓冲区中（缓冲区按ID从新到旧排列，已被挤出的条目不再合并）。
+        从 logs.json 迁移的旧日志没有ID，视为0。
+        """
+        return bool(self.buffer) and log_entry["id"] >= self.buffer[-1].get("id", 0)
 
 log_manager = LogManager() 
\ No newline at end of file
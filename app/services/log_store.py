@@ -0,0 +1,506 @@
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from time import monotonic
+
+class SegmentedLogStore:
+    """
+    分段的只追加日志存储。
+    日志追加到当前活动段，活动段超过 segment_max_bytes 字节或 segment_max_age 秒后封存并开启新段；
+    封存的段在后台线程中压缩为gzip，并按总字节数 retention_bytes 和保留天数 retention_days 删除最旧的段。
+    段文件名为 logs-<首条日志ID>-<创建时间>.log[.gz]，按首条日志ID排序即为时间顺序。
+
+    每条记录的格式为：头部(魔数, 长度, CRC32) + JSON + 尾部(长度, 魔数)。
+    写了一半的记录只可能出现在活动段末尾，启动时从文件末尾向前扫描到最后一条完整记录并截断，
+    正常情况下只需校验最后一条记录，恢复耗时与文件大小无关。
+    """
+    SEGMENT_PATTERN = re.compile(r'^logs-(\d+)-(\d+)\.log(\.gz)?$')
+    # 魔数包含 0x1e，JSON编码后的正文中不会出现该字节
+    HEADER = struct.Struct('>2sII')  # 魔数, 正文长度, 正文CRC32
+    HEADER_MAGIC = b'\x1e\x01'
+    FOOTER = struct.Struct('>I2s')  # 正文长度, 魔数
+    FOOTER_MAGIC = b'\x1e\x02'
+    SCAN_BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, directory, segment_max_bytes=1024 * 1024, segment_max_age=86400,
+                 retention_bytes=50 * 1024 * 1024, retention_days=90, on_error=None):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.retention_bytes = retention_bytes
+        self.retention_days = retention_days
+        self.on_error = on_error or (lambda message: None)
+        self.active_path = None
+        self.active_created = None
+        self.active_size = 0
+        self.maintaining = False
+        self._append_lock = Lock()
+        self._maintenance_lock = Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        if segments and segments[-1][2].endswith('.log'):
+            _first_id, self.active_created, self.active_path, _archived = segments[-1]
+            self.active_size = self._recover_tail(self.active_path)
+        # 压缩上次运行遗留的未压缩封存段，并执行保留策略
+        self._start_maintenance()
+
+    def _segments(self):
+        """返回所有段 [(首条ID, 创建时间, 路径, 是否已压缩)]，按时间从旧到新排序"""
+        segments = []
+        for name in os.listdir(self.directory):
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append((int(match.group(1)), int(match.group(2)), os.path.join(self.directory, name), bool(match.group(3))))
+        segments.sort()
+        return segments
+
+    def append(self, entries, fsync=False):
+        """
+        追加一批日志条目（按时间从旧到新）。
+        :param fsync: 写入后是否强制刷盘
+        """
+        if not entries:
+            return
+        payload = b''.join(self._encode(entry) for entry in entries)
+        with self._append_lock:
+            rotated = False
+            if self.active_path is None or self._active_is_full():
+                self._open_segment(entries[0].get('id') or 0)
+                rotated = True
+            with open(self.active_path, 'ab') as f:
+                f.write(payload)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.active_size += len(payload)
+
+        if rotated:
+            self._start_maintenance()
+
+    def _active_is_full(self):
+        if self.active_size >= self.segment_max_bytes:
+            return True
+        return self.active_size > 0 and time.time() - self.active_created >= self.segment_max_age
+
+    def _open_segment(self, first_id):
+        """开启新的活动段，原活动段即成为封存段"""
+        created = int(time.time())
+        self.active_path = os.path.join(self.directory, f'logs-{first_id:012d}-{created}.log')
+        self.active_created = created
+        self.active_size = 0
+
+    def read(self, limit=500):
+        """
+        读取最近的日志条目，按时间从新到旧返回。
+        从最新的段向前读取，读够 limit 条即停止，不需要解压全部历史。
+        合并更新的条目会以相同ID再次追加，较新的写入优先。
+        从 logs.json 迁移的旧日志没有ID，按其在段中的位置排序。
+        """
+        latest = {}
+        created_count = 0
+        segments = self._segments()
+        for segment_index in range(len(segments) - 1, -1, -1):
+            first_id, _created, path, _archived = segments[segment_index]
+            segment_entries = self._latest_entries(self._iter_segment(path))
+            for position, (key, entry) in enumerate(segment_entries.items()):
+                if key not in latest:
+                    latest[key] = ((entry.get('id', 0), segment_index, position), entry)
+                    # 只统计本段及更新段中创建的条目，更旧的条目不可能排在它们前面
+                    if entry.get('id', 0) >= first_id:
+                        created_count += 1
+            if created_count >= limit:
+                break
+        entries = sorted(latest.values(), key=lambda item: item[0], reverse=True)
+        return [entry for _sort_key, entry in entries[:limit]]
+
+    def _latest_entries(self, entries):
+        """只保留每个ID的最后一次写入，位置按首次出现排序"""
+        latest = {}
+        for index, entry in enumerate(entries):
+            latest[entry.get('id') or ('legacy', index)] = entry
+        return latest
+
+    def iter_entries(self):
+        """
+        按时间从旧到新逐条遍历所有段，每个ID只产出一次，内容为其最新状态。
+        合并更新的条目会以相同ID再次追加，此时其ID不大于之前已出现的最大ID。
+        第一遍记下首次出现的ID（递增，紧凑存储）和再次追加的条目，第二遍在原位置产出最新状态并跳过重复。
+        """
+        first_seen = array('q')
+        updates = {}
+        for entry in self._iter_all():
+            entry_id = entry.get('id')
+            if entry_id is None:
+                continue
+            if not first_seen or entry_id > first_seen[-1]:
+                first_seen.append(entry_id)
+            else:
+                updates[entry_id] = entry
+
+        # 原条目所在的段已按保留策略删除时，按ID顺序插入到输出中
+        orphans = sorted(entry_id for entry_id in updates if not self._contains(first_seen, entry_id))
+        orphan_index = 0
+        last_id = 0
+        for entry in self._iter_all():
+            entry_id = entry.get('id')
+            if entry_id is None:
+                # 旧版日志没有ID，不会被合并更新
+                yield entry
+            elif entry_id > last_id:
+                while orphan_index < len(orphans) and orphans[orphan_index] < entry_id:
+                    yield updates[orphans[orphan_index]]
+                    orphan_index += 1
+                last_id = entry_id
+                yield updates.get(entry_id, entry)
+        for entry_id in orphans[orphan_index:]:
+            yield updates[entry_id]
+
+    @staticmethod
+    def _contains(sorted_ids, entry_id):
+        index = bisect_left(sorted_ids, entry_id)
+        return index < len(sorted_ids) and sorted_ids[index] == entry_id
+
+    def _iter_all(self):
+        """按写入顺序逐条遍历所有段中的记录"""
+        for _first_id, _created, path, _archived in self._segments():
+            yield from self._iter_segment(path)
+
+    def last_id(self):
+        """返回最大的日志ID（旧版日志没有ID，视为0）"""
+        return max((entry.get('id', 0) for entry in self.read(1)), default=0)
+
+    def _iter_segment(self, path):
+        """解析一个段，跳过损坏或写了一半的记录"""
+        if not path.endswith('.gz') and not os.path.exists(path):
+            # 段在列出之后已被压缩
+            path = f'{path}.gz'
+        try:
+            opener = gzip.open if path.endswith('.gz') else open
+            # 段大小受 segment_max_bytes 限制，整段读入后按帧解析
+            with opener(path, 'rb') as f:
+                data = f.read()
+            yield from self._iter_records(data)
+        except FileNotFoundError:
+            # 段在读取期间被压缩或按保留策略删除
+            return
+        except (OSError, EOFError) as e:
+            self.on_error(f"读取日志段失败 {path}: {e}")
+
+    def _iter_records(self, data):
+        """按帧解析记录；遇到损坏的记录时向后寻找下一个记录头继续"""
+        position = 0
+        while position + self.HEADER.size <= len(data):
+            payload = self._record_at(data, position)
+            if payload is not None:
+                entry = self._decode(payload)
+                if entry is not None:
+                    yield entry
+                position += self.HEADER.size + len(payload) + self.FOOTER.size
+                continue
+            next_position = data.find(self.HEADER_MAGIC, position + 1)
+            if next_position == -1:
+                break
+            position = next_position
+
+    def _record_at(self, data, position):
+        """校验从 position 开始的记录，完整时返回正文，否则返回 None"""
+        magic, length, crc = self.HEADER.unpack_from(data, position)
+        end = position + self.HEADER.size + length + self.FOOTER.size
+        if magic != self.HEADER_MAGIC or end > len(data):
+            return None
+        payload = data[position + self.HEADER.size:end - self.FOOTER.size]
+        footer_length, footer_magic = self.FOOTER.unpack_from(data, end - self.FOOTER.size)
+        if footer_magic != self.FOOTER_MAGIC or footer_length != length or zlib.crc32(payload) != crc:
+            return None
+        return payload
+
+    def _record_ends_at(self, f, end):
+        """检查文件中是否有一条完整的记录恰好在 end 处结束"""
+        if end < self.HEADER.size + self.FOOTER.size:
+            return False
+        f.seek(end - self.FOOTER.size)
+        length, magic = self.FOOTER.unpack(f.read(self.FOOTER.size))
+        start = end - self.FOOTER.size - length - self.HEADER.size
+        if magic != self.FOOTER_MAGIC or start < 0:
+            return False
+        f.seek(start)
+        return self._record_at(f.read(end - start), 0) is not None
+
+    def _recover_tail(self, path):
+        """
+        从文件末尾向前扫描，找到最后一条完整记录的结束位置，截断其后写了一半的数据。
+        :return: 恢复后的文件大小
+        """
+        size = os.path.getsize(path)
+        if size == 0:
+            return 0
+        with open(path, 'r+b') as f:
+            valid_end = 0
+            window_end = size
+            while window_end > 0 and not valid_end:
+                window_start = max(0, window_end - self.SCAN_BLOCK_SIZE)
+                f.seek(window_start)
+                # 多读一个字节，避免漏掉跨越窗口边界的尾部魔数
+                data = f.read(min(window_end + 1, size) - window_start)
+                position = data.rfind(self.FOOTER_MAGIC)
+                while position != -1:
+                    candidate = window_start + position + len(self.FOOTER_MAGIC)
+                    if candidate <= size and self._record_ends_at(f, candidate):
+                        valid_end = candidate
+                        break
+                    position = data.rfind(self.FOOTER_MAGIC, 0, position + len(self.FOOTER_MAGIC) - 1)
+                window_end = window_start
+
+            if valid_end < size:
+                f.truncate(valid_end)
+                self.on_error(f"日志段 {path} 末尾有 {size - valid_end} 字节的不完整记录，已截断")
+        return valid_end
+
+    def _encode(self, entry):
+        payload = json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return (self.HEADER.pack(self.HEADER_MAGIC, len(payload), zlib.crc32(payload))
+                + payload
+                + self.FOOTER.pack(len(payload), self.FOOTER_MAGIC))
+
+    def _decode(self, payload):
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8', errors='replace')
+        payload = payload.strip()
+        if not payload:
+            return None
+        try:
+            entry = json.loads(payload)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(entry, dict) and 'timestamp' in entry:
+            return entry
+        return None
+
+    def _start_maintenance(self):
+        """在后台线程中压缩封存段并执行保留策略"""
+        with self._maintenance_lock:
+            if self.maintaining:
+                return
+            self.maintaining = True
+        Thread(target=self._maintain, name='auto-limit-log-maintenance', daemon=True).start()
+
+    def _maintain(self):
+        try:
+            for _first_id, _created, path, archived in self._segments():
+                if not archived and path != self.active_path:
+                    self._compress(path)
+            self._enforce_retention()
+        except Exception as e:
+            self.on_error(f"维护日志段失败: {e}")
+        finally:
+            with self._maintenance_lock:
+                self.maintaining = False
+
+    def _compress(self, path):
+        """把封存段压缩为gzip，完成后删除原文件"""
+        archive_path = f'{path}.gz'
+        temp_path = f'{archive_path}.tmp'
+        try:
+            with open(path, 'rb') as source, gzip.open(temp_path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.replace(temp_path, archive_path)
+            os.unlink(path)
+        except OSError as e:
+            self.on_error(f"压缩日志段失败 {path}: {e}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def _enforce_retention(self):
+        """从最旧的封存段开始删除，直到总大小和最旧段的时间都满足保留策略"""
+        segments = [(path, os.path.getsize(path), os.path.getmtime(path))
+                    for _first_id, _created, path, _archived in self._segments()]
+        total_bytes = sum(size for _path, size, _mtime in segments)
+        cutoff = time.time() - self.retention_days * 86400 if self.retention_days else None
+        for path, size, mtime in segments:
+            if path == self.active_path:
+                break
+            too_large = self.retention_bytes and total_bytes > self.retention_bytes
+            too_old = cutoff is not None and mtime < cutoff
+            if not too_large and not too_old:
+                break
+            try:
+                os.unlink(path)
+                total_bytes -= size
+            except OSError as e:
+                self.on_error(f"删除过期日志段失败 {path}: {e}")
+
+    def migrate_from_json(self, legacy_path):
+        """
+        把旧版的 logs.json（从新到旧的JSON数组）迁移到段存储。
+        迁移成功后旧文件重命名为 .migrated，保留一份以备回退。
+        """
+        if not os.path.exists(legacy_path) or self._segments():
+            return False
+        try:
+            with open(legacy_path, 'r', encoding='utf-8', errors='replace') as f:
+                legacy_logs = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            self.on_error(f"迁移旧日志文件失败: {e}")
+            legacy_logs = []
+
+        entries = [entry for entry in reversed(legacy_logs) if isinstance(entry, dict) and 'timestamp' in entry]
+        self.append(entries)
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        return True
+
+class SqliteLogStore:
+    """
+    基于SQLite的日志存储。
+    以自增ID为主键，并在时间戳和事件类型上建立索引，可以保留数月的日志，
+    按游标分页和按类型过滤的查询耗时不随历史增长而变化。
+    超过 retention_days 天的日志会被定期清理。
+    """
+    PURGE_INTERVAL = 3600  # 清理过期日志的最短间隔（秒）
+
+    def __init__(self, path, retention_days=90, on_error=None):
+        self.path = path
+        self.retention_days = retention_days
+        self.on_error = on_error or (lambda message: None)
+        self.last_purge = None
+        self.synchronous = None
+        self._lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self._lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS logs ('
+                'id INTEGER PRIMARY KEY, '
+                'timestamp TEXT NOT NULL, '
+                'type TEXT NOT NULL, '
+                'message TEXT NOT NULL, '
+                'params TEXT)'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_logs_type_id ON logs (type, id)')
+
+    def append(self, entries, fsync=False):
+        """
+        追加一批日志条目（按时间从旧到新）。
+        :param fsync: 为 True 时以 synchronous=FULL 提交，否则以 NORMAL 提交（WAL模式下仍不会损坏数据库）
+        """
+        if not entries:
+            return
+        rows = [(entry.get('id'), entry['timestamp'], entry['type'], *self._encode_message(entry)) for entry in entries]
+        try:
+            with self._lock:
+                synchronous = 'FULL' if fsync else 'NORMAL'
+                if synchronous != self.synchronous:
+                    self.connection.execute(f'PRAGMA synchronous={synchronous}')
+                    self.synchronous = synchronous
+                with self.connection:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO logs (id, timestamp, type, message, params) VALUES (?, ?, ?, ?, ?)', rows
+                    )
+        except sqlite3.Error as e:
+            raise IOError(e)
+        self._purge_expired()
+
+    def read(self, limit=500):
+        """读取最近的日志条目，按时间从新到旧返回"""
+        return self.query(limit=limit)
+
+    def query(self, before_id=None, types=None, limit=50):
+        """
+        按游标分页查询日志，按时间从新到旧返回。
+        :param before_id: 只返回ID小于该值的日志（上一页最后一条的ID）
+        :param types: 事件类型列表，为空时不过滤
+        """
+        conditions = []
+        params = []
+        if before_id is not None:
+            conditions.append('id < ?')
+            params.append(before_id)
+        if types:
+            conditions.append(f"type IN ({','.join('?' for _type in types)})")
+            params.extend(types)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        params.append(limit)
+        try:
+            with self._lock:
+                rows = self.connection.execute(
+                    f'SELECT id, timestamp, type, message, params FROM logs {where} ORDER BY id DESC LIMIT ?', params
+                ).fetchall()
+        except sqlite3.Error as e:
+            raise IOError(e)
+        return [self._decode_row(row) for row in rows]
+
+    def _encode_message(self, entry):
+        """把条目的模板、参数和合并信息转换为 (message, params) 两列"""
+        if 'template' not in entry:
+            return entry.get('message', ''), None
+        params = {key: entry[key] for key in ('args', 'kwargs', 'count', 'last_seen') if entry.get(key)}
+        return entry['template'], json.dumps(params, ensure_ascii=False) if params else None
+
+    def _decode_row(self, row):
+        entry = {'id': row['id'], 'timestamp': row['timestamp'], 'type': row['type'], 'template': row['message']}
+        if row['params']:
+            entry.update(json.loads(row['params']))
+        return entry
+
+    def iter_entries(self, batch_size=500):
+        """按时间从旧到新分批遍历所有日志"""
+        last_id = 0
+        while True:
+            try:
+                with self._lock:
+                    rows = self.connection.execute(
+                        'SELECT id, timestamp, type, message, params FROM logs WHERE id > ? ORDER BY id LIMIT ?',
+                        (last_id, batch_size)
+                    ).fetchall()
+            except sqlite3.Error as e:
+                raise IOError(e)
+            if not rows:
+                return
+            for row in rows:
+                yield self._decode_row(row)
+            last_id = rows[-1]['id']
+
+    def get_types(self):
+        """返回已记录过的所有事件类型"""
+        with self._lock:
+            rows = self.connection.execute('SELECT DISTINCT type FROM logs ORDER BY type').fetchall()
+        return [row['type'] for row in rows]
+
+    def last_id(self):
+        with self._lock:
+            row = self.connection.execute('SELECT MAX(id) AS id FROM logs').fetchone()
+        return row['id'] or 0
+
+    def import_entries(self, entries):
+        """导入旧存储中的日志（仅在数据库为空时）"""
+        if self.last_id() == 0 and entries:
+            self.append(entries, fsync=True)
+
+    def _purge_expired(self):
+        """删除超过保留天数的日志，最多每 PURGE_INTERVAL 秒执行一次"""
+        now = monotonic()
+        if not self.retention_days or (self.last_purge is not None and now - self.last_purge < self.PURGE_INTERVAL):
+            return
+        self.last_purge = now
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        try:
+            with self._lock, self.connection:
+                self.connection.execute('DELETE FROM logs WHERE timestamp < ?', (cutoff,))
+        except sqlite3.Error as e:
+            self.on_error(f"清理过期日志失败: {e}")
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
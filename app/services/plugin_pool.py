@@ -0,0 +1,117 @@
+import hashlib
+import importlib
+import json
+from threading import RLock
+from .log_manager import log_manager, N_
+from .circuit_breaker import circuit_breakers
+
+class PluginPool:
+    """
+    长期持有插件实例的池。
+    以 (插件类型, 实例ID) 为键，并记录实例配置的指纹，只有配置真正变化时才重建插件，
+    使 requests.Session 的长连接、登录Cookie和会话ID能在多次轮询和请求之间复用。
+    池中插件的 Session 都挂载了实例的断路器，主机不可用时调用会立即失败。
+    """
+    # 插件类名的特殊映射
+    CLASS_NAME_MAPPING = {
+        'clouddrive2': 'CloudDrive2',
+        'qbittorrent': 'Qbittorrent',
+        'transmission': 'Transmission'
+    }
+
+    def __init__(self):
+        self.instances = {}  # {(plugin_type_plural, instance_id): (fingerprint, plugin)}
+        self.lock = RLock()
+
+    def fingerprint(self, instance_config):
+        """计算实例配置的指纹"""
+        payload = json.dumps(instance_config, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def create(self, plugin_type_plural, instance_config):
+        """根据实例配置动态加载并实例化一个新的插件对象（不进入池）"""
+        plugin_type_single = instance_config.get("type")
+        if not plugin_type_single:
+            log_manager.log_formatted_event("PLUGIN_ERROR", N_("实例配置缺少'type'字段: {0}"), instance_config)
+            return None
+        try:
+            # e.g., 'app.media_servers.emby'
+            module_name = f'app.{plugin_type_plural}.{plugin_type_single}'
+
+            if plugin_type_single in self.CLASS_NAME_MAPPING:
+                class_name = self.CLASS_NAME_MAPPING[plugin_type_single]
+            else:
+                # e.g., 'Emby'
+                class_name = ''.join(word.capitalize() for word in plugin_type_single.split('_'))
+
+            module = importlib.import_module(module_name)
+            plugin_class = getattr(module, class_name)
+
+            return plugin_class(instance_config)
+
+        except (ImportError, AttributeError) as e:
+            log_manager.log_formatted_event("PLUGIN_ERROR", N_("加载插件 {0} 失败: {1}"), plugin_type_single, e)
+            return None
+
+    def get(self, plugin_type_plural, instance_config):
+        """
+        获取池中的插件实例。
+        配置指纹未变化时复用已有实例，否则关闭旧实例并重建。
+        """
+        instance_id = instance_config.get('id')
+        if not instance_id:
+            return self.create(plugin_type_plural, instance_config)
+
+        key = (plugin_type_plural, instance_id)
+        fingerprint = self.fingerprint(instance_config)
+
+        with self.lock:
+            cached = self.instances.get(key)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+
+            if cached:
+                # 配置已变化（例如修正了地址），断路器从闭合状态重新开始
+                circuit_breakers.reset(plugin_type_plural, instance_id)
+            plugin = self.create(plugin_type_plural, instance_config)
+            if cached:
+                self._close(cached[1])
+            if plugin:
+                circuit_breakers.attach(plugin_type_plural, instance_config, plugin)
+                self.instances[key] = (fingerprint, plugin)
+            else:
+                self.instances.pop(key, None)
+            return plugin
+
+    def discard(self, plugin_type_plural, instance_id):
+        """从池中移除并关闭指定实例"""
+        with self.lock:
+            cached = self.instances.pop((plugin_type_plural, instance_id), None)
+        circuit_breakers.reset(plugin_type_plural, instance_id)
+        if cached:
+            self._close(cached[1])
+
+    def prune(self):
+        """移除配置中已不存在或已禁用的实例"""
+        from .config_manager import config_manager
+
+        valid_keys = {('media_servers', instance['id']) for instance in config_manager.get_enabled_media_servers()}
+        valid_keys.update(('downloaders', instance['id']) for instance in config_manager.get_enabled_downloaders())
+
+        with self.lock:
+            stale_keys = [key for key in self.instances if key not in valid_keys]
+            stale_plugins = [self.instances.pop(key)[1] for key in stale_keys]
+        for plugin_type_plural, instance_id in stale_keys:
+            circuit_breakers.reset(plugin_type_plural, instance_id)
+
+        for plugin in stale_plugins:
+            self._close(plugin)
+
+    def _close(self, plugin):
+        """关闭插件持有的连接，忽略关闭时的错误"""
+        try:
+            plugin.close()
+        except Exception:
+            pass
+
+plugin_pool = PluginPool()
@@ -1,19 +1,34 @@
-import importlib
-from threading import Timer, RLock
-from time import time
+import heapq
+import itertools
+import random
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Thread, Condition, Lock, RLock
+from time import time, monotonic
 from flask import current_app
-from flask_babel import _
 from .config_manager import config_manager
-from .log_manager import log_manager
-from ..utils import should_skip_speed_limit
+from .circuit_breaker import circuit_breakers
+from .event_bus import event_bus
+from .log_manager import log_manager, N_
+from .plugin_pool import plugin_pool
+from ..utils import WhitelistMatcher
 
 class Scheduler:
     """
     负责动态加载插件、定时检查状态和更新速率的核心调度器。
     支持每个媒体服务器实例独立的轮询间隔。
+    所有媒体服务器共用一个调度线程：按截止时间排序的最小堆决定下一次轮询，
+    到期的轮询交给有界的工作线程池执行，线程数量不随媒体服务器数量增长。
+    轮询得到的会话、比特率和下载器速度保存在快照中，仪表盘API直接读取快照，不再访问上游。
     """
-    def __init__(self):
-        self.timers = {}  # 存储每个媒体服务器的定时器 {server_id: timer}
+    # 下载器速度采样任务在调度队列中的ID
+    DOWNLOADER_SAMPLER_JOB = 'downloaders'
+    # 限速迟滞计时任务在调度队列中的ID：等待中的切换或逐级恢复的下一步到期时执行
+    THROTTLE_JOB = 'throttle'
+    # 自适应轮询：空闲时每轮的间隔倍数，以及每次间隔的随机抖动比例
+    ADAPTIVE_BACKOFF = 2.0
+    POLL_JITTER = 0.1
+
+    def __init__(self, max_workers=4):
         self.active_session_ids = set()  # 所有活跃会话的合并集合
         self.last_speed_state = {}  # 记录每个下载器的最后速率状态 {downloader_id: (dl_limit, ul_limit)}
         self.last_session_count = 0  # 记录上次的会话数量
@@ -23,9 +38,66 @@ class Scheduler:
         self.lock = RLock()
         self.app = None
 
+        # 调度队列：最小堆 [(deadline, seq, job_id)]，deadline 为 monotonic 时间
+        self.max_workers = max_workers
+        # 任务ID为媒体服务器ID，或下载器采样任务 DOWNLOADER_SAMPLER_JOB
+        self.schedule = []
+        self.deadlines = {}  # 每个任务当前有效的截止时间 {job_id: deadline}，堆中其余条目视为过期
+        self.in_flight = {}  # 正在执行的任务 {job_id: generation}
+        self.tick_stats = {}  # 任务计时统计 {job_id: {...}}
+        self.generation = 0  # 每次重新调度递增，用于丢弃旧调度周期的结果
+        self.schedule_lock = Lock()
+        self.wakeup = Condition(self.schedule_lock)
+        self.sequence = itertools.count()
+        self.loop_thread = None
+        self.executor = None
+        self.call_timeout = 12  # 单次插件调用的截止时间（秒）
+
+        # 并发下发速率的线程池和每个下载器最近一次的下发结果
+        self.max_apply_workers = 8
+        self.apply_executor = None
+        self.last_apply_results = {}  # {downloader_id: {'success', 'latency', 'error', 'at'}}
+        self.last_apply_duration = None
+        self.apply_locks = {}  # {downloader_id: Lock}，同一下载器的限速调用串行执行
+        self.apply_sequence = itertools.count(1)
+        self.latest_apply = {}  # {downloader_id: 最近一次请求的调用序号}，已被更新请求取代的调用不再执行，其结果也不再记录
+        self.applying = {}  # {downloader_id: (dl_limit, ul_limit)}，已发出但尚未记录结果的最新下发
+
+        # 限速对账：定期读回下载器的实际限速，与期望状态不一致时重新下发
+        self.reconcile_interval = 60  # 读回实际限速的间隔（秒），0 表示只重试下发失败的限速
+        self.last_reconcile = 0.0  # 上一次读回的 monotonic 时间
+        self.pending_limits = {}  # 下发失败、等待下载器恢复后重新下发的期望限速 {downloader_id: (dl_limit, ul_limit)}
+        self.actual_limits = {}  # 最近一次读回的实际限速 {downloader_id: (dl_limit, ul_limit)}
+
+        # 限速迟滞：播放状态需持续一段时间才切换限速模式，启用播放限速后至少保持 min_hold 秒，
+        # 恢复默认限速时可以逐级放开，避免短暂暂停、拖动进度、切换剧集导致限速反复切换
+        self.engage_delay = 0.0  # 出现需要限速的播放后，持续多少秒才切换到播放限速
+        self.release_delay = 30.0  # 播放全部停止后，持续多少秒才恢复默认限速
+        self.min_hold = 60.0  # 启用播放限速后至少保持的秒数，只推迟恢复默认限速
+        self.release_ramp_steps = 0  # 恢复默认限速时的中间步数（每步速率翻倍），0 表示直接恢复
+        self.release_ramp_interval = 10.0  # 逐级恢复时每一步的间隔（秒）
+        self.throttled = False  # 当前生效的限速模式（经过迟滞后），True 为播放时限速
+        self.throttle_changed_at = None  # 上一次切换限速模式的 monotonic 时间
+        self.throttle_pending_since = None  # 播放状态与生效模式不一致的起始 monotonic 时间
+        self.ramp_step = None  # 逐级恢复的当前步数（从1开始），None 表示不在逐级恢复中
+
+        # 最近一次轮询结果的快照，供仪表盘API读取
+        self.sample_interval = 5  # 下载器速度采样间隔（秒）
+        self.server_snapshots = {}  # {server_id: {'name', 'type', 'sessions', 'speeds', 'updated_at'}}
+        self.downloader_snapshots = {}  # {downloader_id: {'current_speeds', 'updated_at'}}
+        self.state_version = 0  # 仪表盘可见状态每次变化时递增，用作ETag
+        self.version_lock = Lock()  # 只保护 state_version，插件线程（断路器回调）也会获取，不能换成 self.lock
+
+        # 最近一次应用到调度中的实例配置，用于增量重新配置 {(实例类型, 实例ID): 实例配置}
+        self.applied_instances = {}
+        # 自适应轮询的状态 {server_id: (当前间隔, 上一轮是否有会话)}
+        self.adaptive_state = {}
+
     def init_app(self, app):
         """用Flask app实例来初始化调度器"""
         self.app = app
+        # 断路器断开或恢复时刷新仪表盘
+        circuit_breakers.listener = self._bump_version
 
     def start(self):
         """启动调度器的主循环"""
@@ -36,256 +108,1049 @@ class Scheduler:
             with self.lock:
                 if not self.running:
                     self.running = True
-                    log_manager.log_event("SCHEDULER", _("调度器已启动"))
+                    self._bump_version()
+                    self._ensure_loop()
+                    log_manager.log_event("SCHEDULER", N_("调度器已启动"))
                     self._schedule_all_servers()
 
     def stop(self):
         """停止调度器"""
         with self.lock:
-            # 取消所有定时器
-            for timer in self.timers.values():
-                if timer:
-                    timer.cancel()
-            self.timers.clear()
-            # 清理状态记录
+            # 清空调度队列，正在执行的轮询完成后不会再被调度
+            with self.wakeup:
+                self.schedule.clear()
+                self.deadlines.clear()
+                self.generation += 1
+                self.wakeup.notify()
+            # 清理状态记录，正在进行的下发随之作废
             self.last_speed_state.clear()
+            self.latest_apply.clear()
+            self.applying.clear()
             self.active_session_ids.clear()
+            self._reset_throttle()
             self.last_session_count = 0
             self.last_status_log_time = 0
             self.last_skip_log_time.clear()
             self.running = False
+            self._bump_version()
         
         # 仅在app上下文可用时记录日志
         if self.app:
             with self.app.app_context():
-                log_manager.log_event("SCHEDULER", _("调度器已停止"))
+                log_manager.log_event("SCHEDULER", N_("调度器已停止"))
 
-    def restart(self):
-        """重启调度器以应用新配置"""
-        # 保存当前的速率状态，避免重启后重复设置相同速率
-        saved_speed_state = self.last_speed_state.copy()
-        
-        self.stop()
-        self.start()
-        
-        # 恢复速率状态
-        self.last_speed_state = saved_speed_state
+    def reconfigure(self):
+        """
+        增量应用新配置：与上次应用的配置比较，只处理新增、删除或修改的实例。
+        未受影响的服务器保留轮询节拍、会话状态和插件连接；调度器未运行时等同于 start()。
+        """
+        if self.app is None:
+            raise RuntimeError("Scheduler has not been initialized. Call init_app(app) first.")
+        if not self.running:
+            self.start()
+            return
+
+        with self.app.app_context():
+            with self.lock:
+                scheduler_settings = config_manager.get_settings().get('scheduler', {})
+                self._configure_pools(scheduler_settings)
+                self.call_timeout = float(scheduler_settings.get('call_timeout', 12))
+                circuit_breakers.configure(scheduler_settings)
+                sample_interval = float(scheduler_settings.get('sample_interval', 5))
+                self.reconcile_interval = float(scheduler_settings.get('reconcile_interval', 60))
+                throttle_changed = self._configure_throttle(scheduler_settings)
+                plugin_pool.prune()
+
+                previous = self.applied_instances
+                current = self._enabled_instances()
+                self.applied_instances = current
+                if current == previous and sample_interval == self.sample_interval:
+                    if throttle_changed:
+                        # 迟滞设置变化后重新计算等待中切换的到期时间
+                        self._submit_speed_update()
+                    return
+
+                for plugin_type_plural, instance_id in previous.keys() - current.keys():
+                    if plugin_type_plural == 'media_servers':
+                        self._remove_server(instance_id)
+                    else:
+                        self._remove_downloader(instance_id)
+
+                # 配置变化的下载器（地址、类型、凭据等）可能已指向另一个端点：丢弃旧的限速状态，下面重新下发
+                for (plugin_type_plural, instance_id), instance in current.items():
+                    old_instance = previous.get((plugin_type_plural, instance_id))
+                    if plugin_type_plural == 'downloaders' and old_instance is not None and old_instance != instance:
+                        self._remove_downloader(instance_id)
+
+                now = monotonic()
+                for (plugin_type_plural, server_id), server_instance in current.items():
+                    if plugin_type_plural != 'media_servers':
+                        continue
+                    old_instance = previous.get((plugin_type_plural, server_id))
+                    # 新增服务器或轮询设置变化时才重新安排，其余修改在下一次轮询时自然生效
+                    if old_instance is not None and self._poll_settings(old_instance) == self._poll_settings(server_instance):
+                        continue
+                    self._schedule_server(server_instance, now)
+
+                downloaders_added = any(key[0] == 'downloaders' and key not in previous for key in current)
+                if downloaders_added or sample_interval != self.sample_interval:
+                    self.sample_interval = sample_interval
+                    with self.wakeup:
+                        self._push_deadline(self.DOWNLOADER_SAMPLER_JOB, now)
+
+                self._bump_version()
+                # 限速配置或活跃会话可能已变化，在工作线程中按需下发，不阻塞保存配置的请求
+                self._submit_speed_update()
+
+    def _enabled_instances(self):
+        """当前配置中所有启用的实例 {(实例类型, 实例ID): 实例配置}"""
+        instances = {('media_servers', s['id']): s for s in config_manager.get_enabled_media_servers()}
+        instances.update((('downloaders', d['id']), d) for d in config_manager.get_enabled_downloaders())
+        return instances
+
+    def _remove_server(self, server_id):
+        """停止轮询已删除或已禁用的服务器，并丢弃它的会话和快照"""
+        with self.wakeup:
+            self.deadlines.pop(server_id, None)
+            self.tick_stats.pop(server_id, None)
+        with self.lock:
+            prefix = f"{server_id}:"
+            stale_sessions = {sid for sid in self.active_session_ids if sid.startswith(prefix)}
+            self.active_session_ids.difference_update(stale_sessions)
+            self.server_snapshots.pop(server_id, None)
+            self.adaptive_state.pop(server_id, None)
+        self._bump_version()
+        # 返回是否移除了需要限速的会话
+        return bool(stale_sessions)
+
+    def _remove_downloader(self, downloader_id):
+        """丢弃已删除或已禁用下载器的限速状态和快照"""
+        with self.lock:
+            self.last_speed_state.pop(downloader_id, None)
+            self.last_apply_results.pop(downloader_id, None)
+            limits_known = downloader_id in self.pending_limits or downloader_id in self.actual_limits
+            self.pending_limits.pop(downloader_id, None)
+            self.actual_limits.pop(downloader_id, None)
+            self.downloader_snapshots.pop(downloader_id, None)
+            # 正在进行的下发随之作废，不再记录其结果
+            self.latest_apply.pop(downloader_id, None)
+            self.applying.pop(downloader_id, None)
+        if limits_known:
+            self._bump_version()
+
+    def _submit_speed_update(self):
+        """在工作线程中按当前会话状态重新计算并下发速率"""
+        def update():
+            with self.app.app_context():
+                with self.lock:
+                    changes = self._update_speed()
+                self._apply_limit_changes(changes)
+        self.executor.submit(update)
+
+    def _configure_pools(self, scheduler_settings):
+        """
+        应用轮询线程池和下载器调用线程池的大小。
+        poll_workers / apply_workers 为 0 时按启用的实例数自动调整：每个媒体服务器
+        独占一个轮询线程（另加采样和限速节拍两个内部任务），每个下载器可同时占用
+        采样和下发两个线程，慢速或无响应的主机只会占住自己的线程，不会拖慢其他实例。
+        大小变化时换用新的线程池；旧线程池不显式关闭，已提交的调用照常完成，
+        不再被引用后其空闲线程自动退出。
+        """
+        max_workers = int(scheduler_settings.get('poll_workers', 0))
+        if max_workers <= 0:
+            max_workers = len(config_manager.get_enabled_media_servers()) + 2
+        max_apply_workers = int(scheduler_settings.get('apply_workers', 0))
+        if max_apply_workers <= 0:
+            max_apply_workers = max(1, 2 * len(config_manager.get_enabled_downloaders()))
+        with self.wakeup:
+            if max_workers != self.max_workers:
+                self.max_workers = max_workers
+                if self.executor is not None:
+                    self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='auto-limit-poll')
+        with self.lock:
+            if max_apply_workers != self.max_apply_workers:
+                self.max_apply_workers = max_apply_workers
+                self.apply_executor = None
+
+    def _ensure_loop(self):
+        """确保调度线程和工作线程池已经启动（调度线程在整个进程生命周期内只创建一次）"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='auto-limit-poll')
+        if self.loop_thread is None or not self.loop_thread.is_alive():
+            self.loop_thread = Thread(target=self._run_loop, name='auto-limit-scheduler', daemon=True)
+            self.loop_thread.start()
+
+    def _push_deadline(self, job_id, deadline):
+        """将任务的下一次执行加入调度队列（调用方需持有 schedule_lock）"""
+        self.deadlines[job_id] = deadline
+        heapq.heappush(self.schedule, (deadline, next(self.sequence), job_id))
+        self.wakeup.notify()
+
+    def _run_loop(self):
+        """调度线程：等待最早的截止时间，到期后把轮询提交给工作线程池"""
+        with self.wakeup:
+            while True:
+                if not self.schedule:
+                    self.wakeup.wait()
+                    continue
+
+                deadline, _seq, job_id = self.schedule[0]
+                now = monotonic()
+                if deadline > now:
+                    self.wakeup.wait(deadline - now)
+                    continue
+
+                heapq.heappop(self.schedule)
+                # 跳过已被重新调度或移除的过期条目
+                if self.deadlines.get(job_id) != deadline:
+                    continue
+                del self.deadlines[job_id]
+
+                if job_id in self.in_flight:
+                    # 上一周期的任务仍在执行，稍后再试，避免同一任务并发执行
+                    self._push_deadline(job_id, now + 1)
+                    continue
+
+                self.in_flight[job_id] = self.generation
+                self.executor.submit(self._run_tick, job_id, deadline, self.generation)
+
+    def _run_tick(self, job_id, deadline, generation):
+        """在工作线程中执行一次轮询，并按固定节拍安排下一次"""
+        started = monotonic()
+        poll_interval = None
+        try:
+            poll_interval = self._run_job(job_id)
+        except Exception as e:
+            if self.app:
+                self.app.logger.error(f"执行调度任务 {job_id} 时出错: {e}")
+        finally:
+            self._finish_tick(job_id, deadline, generation, started, poll_interval)
+
+    def _finish_tick(self, job_id, deadline, generation, started, poll_interval):
+        """记录轮询计时，并按固定节拍安排下一次"""
+        finished = monotonic()
+        with self.wakeup:
+            if self.in_flight.get(job_id) == generation:
+                del self.in_flight[job_id]
+
+            stats = self.tick_stats.setdefault(job_id, {'ticks': 0, 'max_lateness': 0.0})
+            lateness = started - deadline
+            stats['ticks'] += 1
+            stats['last_lateness'] = lateness
+            stats['max_lateness'] = max(stats['max_lateness'], lateness)
+            stats['last_duration'] = finished - started
+            stats['last_run'] = time()
+
+            if poll_interval and self.running and generation == self.generation:
+                # 以上一次的截止时间为基准推进，避免执行耗时累积成漂移；错过的节拍直接跳过
+                next_deadline = deadline + poll_interval
+                while next_deadline <= finished:
+                    next_deadline += poll_interval
+                self._push_deadline(job_id, next_deadline)
+            elif generation == self.generation:
+                self.tick_stats.pop(job_id, None)
+
+    def get_tick_stats(self):
+        """获取每个服务器的轮询计时统计（延迟、耗时均为秒）"""
+        with self.wakeup:
+            return {server_id: dict(stats) for server_id, stats in self.tick_stats.items()}
 
     def _schedule_all_servers(self):
-        """为所有启用的媒体服务器创建独立的定时器"""
+        """为所有启用的媒体服务器安排首次轮询"""
         if not self.running:
             return
             
         settings = config_manager.get_settings()
         
-        # 清理已有的定时器
-        with self.lock:
-            for timer in self.timers.values():
-                if timer:
-                    timer.cancel()
-            self.timers.clear()
+        # 关闭已删除或已禁用实例的插件连接
+        plugin_pool.prune()
         
-        # 为每个启用的媒体服务器创建定时器
-        for server_instance in settings.get('media_servers', []):
-            if server_instance.get('enabled'):
-                server_id = server_instance.get('id')
-                poll_interval = float(server_instance.get('poll_interval', 15))
-                
-                if server_id and self.running:
-                    timer = Timer(poll_interval, self._check_server_status, args=[server_id])
-                    timer.daemon = True
-                    self.timers[server_id] = timer
-                    timer.start()
-                    
-                    # 确保在应用上下文中记录日志
-                    if self.app:
-                        with self.app.app_context():
-                            log_manager.log_formatted_event("SCHEDULER", 
-                                _("为服务器 {0} 设置 {1} 秒轮询间隔"), 
-                                server_instance.get('name', server_id), poll_interval)
+        scheduler_settings = settings.get('scheduler', {})
+        self._configure_pools(scheduler_settings)
+        self.call_timeout = float(scheduler_settings.get('call_timeout', 12))
+        self.sample_interval = float(scheduler_settings.get('sample_interval', 5))
+        self.reconcile_interval = float(scheduler_settings.get('reconcile_interval', 60))
+        self._configure_throttle(scheduler_settings)
+        circuit_breakers.configure(scheduler_settings)
+        
+        # 清理已有的调度
+        with self.wakeup:
+            self.schedule.clear()
+            self.deadlines.clear()
+            self.tick_stats.clear()
+            self.generation += 1
+        
+        # 丢弃已删除或已禁用实例的快照
+        self._prune_snapshots()
+        self.applied_instances = self._enabled_instances()
+        
+        # 为每个启用的媒体服务器安排轮询
+        now = monotonic()
+        for server_instance in config_manager.get_enabled_media_servers():
+            if self.running:
+                # 确保在应用上下文中记录日志
+                with self.app.app_context():
+                    self._schedule_server(server_instance, now)
+        
+        # 下载器速度采样，首次采样立即执行
+        if self.running:
+            with self.wakeup:
+                self._push_deadline(self.DOWNLOADER_SAMPLER_JOB, now)
+
+    def _poll_settings(self, server_instance):
+        """影响轮询节拍的配置项，任何一项变化都需要重新安排该服务器"""
+        return (
+            float(server_instance.get('poll_interval', 15)),
+            bool(server_instance.get('adaptive_polling')),
+            self._adaptive_bounds(server_instance)
+        )
+
+    def _adaptive_bounds(self, server_instance):
+        """自适应轮询的最小和最大间隔（秒）"""
+        min_interval = float(server_instance.get('min_poll_interval', 5))
+        max_interval = float(server_instance.get('max_poll_interval', 120))
+        return min_interval, max(min_interval, max_interval)
+
+    def _schedule_server(self, server_instance, now):
+        """
+        安排服务器的首次轮询。
+        自适应模式下首次轮询落在最小间隔内的随机时刻，错开多个服务器的轮询相位。
+        """
+        server_id = server_instance.get('id')
+        self.adaptive_state.pop(server_id, None)
+        if server_instance.get('adaptive_polling'):
+            min_interval, max_interval = self._adaptive_bounds(server_instance)
+            delay = random.uniform(0, min_interval)
+            log_manager.log_formatted_event("SCHEDULER", 
+                N_("为服务器 {0} 启用自适应轮询（{1}-{2} 秒）"), 
+                server_instance.get('name', server_id), min_interval, max_interval)
+        else:
+            delay = float(server_instance.get('poll_interval', 15))
+            log_manager.log_formatted_event("SCHEDULER", 
+                N_("为服务器 {0} 设置 {1} 秒轮询间隔"), 
+                server_instance.get('name', server_id), delay)
+        with self.wakeup:
+            self._push_deadline(server_id, now + delay)
+
+    def _next_poll_interval(self, server_instance, has_sessions):
+        """
+        计算服务器下一次轮询的间隔。
+        固定模式直接使用 poll_interval；自适应模式下有播放或播放刚结束时收紧到最小间隔，
+        持续空闲时每轮按 ADAPTIVE_BACKOFF 倍数放宽直到最大间隔，并加入随机抖动避免多个服务器同步轮询。
+        :param has_sessions: 本轮是否有会话，轮询失败时为 None（保持当前间隔）
+        """
+        if not server_instance.get('adaptive_polling'):
+            return float(server_instance.get('poll_interval', 15))
+
+        server_id = server_instance.get('id')
+        min_interval, max_interval = self._adaptive_bounds(server_instance)
+        interval, was_active = self.adaptive_state.get(server_id, (min_interval, False))
+        if has_sessions is None:
+            pass
+        elif has_sessions or was_active:
+            interval = min_interval
+            was_active = has_sessions
+        else:
+            interval = interval * self.ADAPTIVE_BACKOFF
+        interval = min(max(interval, min_interval), max_interval)
+        self.adaptive_state[server_id] = (interval, was_active)
+        return interval * random.uniform(1 - self.POLL_JITTER, 1 + self.POLL_JITTER)
+
+    def _run_job(self, job_id):
+        """执行一个调度任务，返回下一次执行的间隔（秒）或 None"""
+        if job_id == self.DOWNLOADER_SAMPLER_JOB:
+            return self._sample_downloaders()
+        if job_id == self.THROTTLE_JOB:
+            return self._throttle_tick()
+        return self._check_server_status(job_id)
 
     def _check_server_status(self, server_id):
-        """检查单个媒体服务器的状态"""
+        """
+        检查单个媒体服务器的状态。
+        :return: 下一次轮询的间隔（秒）；服务器已被删除或禁用时返回 None
+        """
         if not self.running or self.app is None:
-            return
+            return None
 
         with self.app.app_context():
-            settings = config_manager.get_settings()
-            
-            # 找到对应的服务器实例
-            server_instance = None
-            for server in settings.get('media_servers', []):
-                if server.get('id') == server_id and server.get('enabled'):
-                    server_instance = server
-                    break
-            
+            # 按ID找到对应的服务器实例
+            server_instance = config_manager.get_media_server(server_id)
             if not server_instance:
-                # 服务器已被删除或禁用
-                with self.lock:
-                    if server_id in self.timers:
-                        del self.timers[server_id]
-                return
+                # 服务器已被删除或禁用，不再调度
+                self._drop_server(server_id)
+                return None
             
             # 获取该服务器的活跃会话
+            has_sessions = None
             media_server = self._get_plugin_instance('media_servers', server_instance)
             if media_server:
-                current_sessions = media_server.get_active_sessions()
+                with log_manager.source(server_id):
+                    current_sessions = media_server.get_active_sessions()
+                    # 只在有播放时获取比特率，空闲时不产生额外请求
+                    speeds = media_server.get_network_speeds() if current_sessions else None
+                # 插件在轮询失败时返回 None，不能当作空闲处理
+                if current_sessions is not None:
+                    has_sessions = bool(current_sessions)
+                self._store_server_snapshot(server_instance, current_sessions, speeds)
+                self._apply_server_sessions(server_id, server_instance, current_sessions)
+            
+            # 由调度线程按此间隔安排下次检查
+            return self._next_poll_interval(server_instance, has_sessions)
+
+    def _sample_downloaders(self):
+        """采样所有启用下载器的当前速度并写入快照，到期时一并读回实际限速并对账"""
+        if not self.running or self.app is None:
+            return None
+        
+        with self.app.app_context():
+            downloaders = config_manager.get_enabled_downloaders()
+            if not downloaders:
+                return self.sample_interval
+            read_limits = self._reconcile_due()
+            
+            def sample(downloader_instance):
+                downloader = self._get_plugin_instance('downloaders', downloader_instance)
+                if not downloader:
+                    return None, None
+                try:
+                    with log_manager.source(downloader_instance.get('id')):
+                        return downloader.sample(read_limits)
+                except Exception as e:
+                    current_app.logger.warning(f"获取下载器 {downloader_instance.get('name', '未知')} 速度失败: {e}")
+                    return None, None
+            
+            # 各下载器并发采样，采样与限速下发共用同一个线程池
+            executor = self._get_apply_executor()
+            futures = {executor.submit(sample, d): d.get('id') for d in downloaders}
+            done, _not_done = wait(futures, timeout=self.call_timeout)
+            samples = {}
+            for future, downloader_id in futures.items():
+                samples[downloader_id] = future.result() if future in done else (None, None)
+            
+            self._finish_sample(samples)
+            return self.sample_interval
+
+    def _finish_sample(self, samples):
+        """保存采样到的速度快照，再对账限速"""
+        for downloader_id, (current_speeds, _actual_limits) in samples.items():
+            self._store_downloader_snapshot(downloader_id, current_speeds)
+        self._reconcile(samples)
+
+    def _reconcile_due(self):
+        """本轮采样是否需要读回实际限速"""
+        if self.reconcile_interval <= 0:
+            return False
+        now = monotonic()
+        if now - self.last_reconcile < self.reconcile_interval:
+            return False
+        self.last_reconcile = now
+        return True
+
+    def _reconcile(self, samples):
+        """
+        让下载器的实际限速与期望状态一致。
+        下发失败的期望限速在下载器恢复响应后重新下发；
+        读回的实际限速与期望不一致（例如在下载器界面被修改、下载器重启）时重新下发。
+        :param samples: {downloader_id: (current_speeds, actual_limits)}，actual_limits 为 None 表示本轮未读回
+        """
+        with self.app.app_context():
+            with self.lock:
+                # 采样节拍同时作为迟滞计时的兜底
+                self._advance_throttle()
+                changes = []
+                for downloader_instance in config_manager.get_enabled_downloaders():
+                    downloader_id = downloader_instance.get('id')
+                    current_speeds, actual_limits = samples.get(downloader_id, (None, None))
+                    if current_speeds is None and actual_limits is None:
+                        # 下载器无响应，等它恢复后再处理
+                        continue
+                    if downloader_id in self.applying:
+                        # 正在下发中，结果由下发流程记录
+                        continue
+                    
+                    desired = self._desired_limits(downloader_instance)
+                    if actual_limits is not None and self.actual_limits.get(downloader_id) != tuple(actual_limits):
+                        self.actual_limits[downloader_id] = tuple(actual_limits)
+                        self._bump_version()
+                    
+                    if self.last_speed_state.get(downloader_id) != desired:
+                        # 期望限速尚未成功下发，例如下发时主机不可用
+                        changes.append((downloader_instance, desired))
+                    elif actual_limits is not None:
+                        downloader = self._get_plugin_instance('downloaders', downloader_instance)
+                        if downloader and not downloader.limits_match(desired, actual_limits):
+                            log_manager.log_formatted_event("SPEED_CHANGE", 
+                                N_("{0} 的实际限速（下载 {1}, 上传 {2}）与期望不一致，重新下发"), 
+                                downloader_instance.get('name', downloader_id), actual_limits[0], actual_limits[1])
+                            changes.append((downloader_instance, desired))
+                changes = self._reserve_applies(changes)
+            self._apply_limit_changes(changes)
+
+    def _store_server_snapshot(self, server_instance, current_sessions, speeds):
+        """保存媒体服务器最近一次轮询的会话和比特率"""
+        server_id = server_instance.get('id')
+        server_name = server_instance.get('name', server_id)
+        sessions = []
+        for session in current_sessions or []:
+            session = dict(session)
+            session['source_server'] = server_name
+            sessions.append(session)
+        
+        with self.lock:
+            previous = self.server_snapshots.get(server_id)
+            self.server_snapshots[server_id] = {
+                'name': server_name,
+                'type': server_instance.get('type', '未知类型'),
+                'sessions': sessions,
+                'speeds': speeds,
+                'ok': current_sessions is not None,
+                'updated_at': time()
+            }
+            if not previous or (previous['sessions'], previous['speeds'], previous['ok']) != (sessions, speeds, current_sessions is not None):
+                self._bump_version()
+
+    def _store_downloader_snapshot(self, downloader_id, current_speeds):
+        """保存下载器最近一次采样的速度"""
+        with self.lock:
+            previous = self.downloader_snapshots.get(downloader_id)
+            self.downloader_snapshots[downloader_id] = {
+                'current_speeds': current_speeds,
+                'updated_at': time()
+            }
+            if not previous or previous['current_speeds'] != current_speeds:
+                self._bump_version()
+
+    def _drop_server(self, server_id):
+        """轮询时发现服务器已不在配置中：移除它残留的会话，必要时恢复下载器速率"""
+        with self.lock:
+            changes = self._update_speed() if self._remove_server(server_id) else []
+        self._apply_limit_changes(changes)
+
+    def _bump_version(self):
+        """
+        标记仪表盘可见状态已变化，并通知SSE订阅者。
+        不获取 self.lock：持有 self.lock 的下发流程会等待插件线程，而插件线程中的断路器会调用这里。
+        """
+        with self.version_lock:
+            self.state_version += 1
+            version = self.state_version
+        event_bus.publish('dashboard', {'version': version})
+
+    def _prune_snapshots(self):
+        """移除已删除或已禁用实例的快照"""
+        server_ids = {s.get('id') for s in config_manager.get_enabled_media_servers()}
+        downloader_ids = {d.get('id') for d in config_manager.get_enabled_downloaders()}
+        with self.lock:
+            for server_id in [k for k in self.server_snapshots if k not in server_ids]:
+                del self.server_snapshots[server_id]
+            for downloader_id in [k for k in self.downloader_snapshots if k not in downloader_ids]:
+                del self.downloader_snapshots[downloader_id]
+            # 实例列表或其限速配置可能已变化
+            self._bump_version()
+
+    def get_sessions_snapshot(self):
+        """
+        获取所有媒体服务器最近一次轮询到的会话（包括被跳过限速的会话）。
+        :return: (sessions, updated_at)
+        """
+        with self.lock:
+            sessions = []
+            updated_at = None
+            for snapshot in self.server_snapshots.values():
+                sessions.extend(dict(session) for session in snapshot['sessions'])
+                updated_at = max(updated_at or 0, snapshot['updated_at'])
+            return sessions, updated_at
+
+    def get_speeds_snapshot(self):
+        """
+        获取所有媒体服务器最近一次轮询到的比特率信息。
+        :return: (total_bitrate, sessions, updated_at)
+        """
+        with self.lock:
+            total_bitrate = 0
+            sessions = []
+            updated_at = None
+            for snapshot in self.server_snapshots.values():
+                updated_at = max(updated_at or 0, snapshot['updated_at'])
+                speed_info = snapshot['speeds']
+                if not speed_info:
+                    continue
+                total_bitrate += speed_info.get('total_bitrate', 0)
+                # 为每个会话添加服务器信息
+                for session in speed_info.get('sessions', []):
+                    session = dict(session)
+                    session['source_server'] = snapshot['name']
+                    session['source_server_type'] = snapshot['type']
+                    sessions.append(session)
+            return total_bitrate, sessions, updated_at
+
+    def get_downloader_snapshot(self, downloader_id):
+        """获取单个下载器最近一次采样的速度快照，尚未采样时返回 None"""
+        with self.lock:
+            snapshot = self.downloader_snapshots.get(downloader_id)
+            return dict(snapshot) if snapshot else None
+
+    def get_downloaders_status(self):
+        """构建下载器状态列表（实际速度来自采样快照）"""
+        downloaders_status = []
+        
+        # 判断当前是否有播放活动
+        has_active_sessions = len(self.active_session_ids) > 0
+        
+        # 生效的限速模式经过迟滞，可能与当前播放状态暂时不一致
+        with self.lock:
+            if self.throttled:
+                speed_mode = 'playing'
+            elif self.ramp_step is not None:
+                speed_mode = 'ramping'
+            else:
+                speed_mode = 'default'
+            throttle_status = self._throttle_status()
+        
+        for downloader_instance in config_manager.get_enabled_downloaders():
+            snapshot = self.get_downloader_snapshot(downloader_instance.get('id')) or {}
+            
+            # 当前应该使用的限速配置
+            with self.lock:
+                active_download_limit, active_upload_limit = self._desired_limits(downloader_instance)
+            
+            downloader_status = {
+                'id': downloader_instance.get('id'),
+                'name': downloader_instance.get('name', '未命名'),
+                'type': downloader_instance.get('type'),
+                'speed_mode': speed_mode,
+                'active_limits': {
+                    'download': active_download_limit,
+                    'upload': active_upload_limit
+                },
+                'current_speeds': snapshot.get('current_speeds'),
+                'updated_at': snapshot.get('updated_at'),
+                'actual_limits': self.actual_limits.get(downloader_instance.get('id')),
+                'pending_limits': self.pending_limits.get(downloader_instance.get('id')),
+                'circuit': circuit_breakers.get_state('downloaders', downloader_instance.get('id'))
+            }
+            
+            downloaders_status.append(downloader_status)
+        
+        return {
+            'status': 'success', 
+            'downloaders': downloaders_status,
+            'has_active_sessions': has_active_sessions,
+            'throttle': throttle_status
+        }
+
+    def _throttle_status(self):
+        """限速迟滞状态，供状态API使用（调用方需持有 self.lock）"""
+        pending = None
+        if self.throttle_pending_since is not None:
+            wanted = not self.throttled
+            due = self._throttle_due(wanted)
+            pending = {
+                'action': 'engage' if wanted else 'release',
+                'in': max(0.0, due - monotonic())
+            }
+        return {
+            'throttled': self.throttled,
+            'pending': pending,
+            'ramp_step': self.ramp_step,
+            'ramp_steps': self.release_ramp_steps
+        }
+
+    def get_dashboard_etag(self):
+        """仪表盘数据的ETag，基于状态版本号和配置版本号"""
+        return f'{self.state_version}-{config_manager.get_version()}-{int(self.running)}'
+
+    def get_dashboard_state(self):
+        """构建仪表盘需要的全部数据，供 /api/dashboard 和SSE推送共用"""
+        sessions, sessions_updated_at = self.get_sessions_snapshot()
+        total_bitrate, speed_sessions, speeds_updated_at = self.get_speeds_snapshot()
+        return {
+            'status': 'success',
+            'version': self.state_version,
+            'health': {
+                'status': 'healthy' if self.running else 'unhealthy',
+                'monitoring': 'active' if self.running else 'inactive'
+            },
+            'sessions': {
+                'status': 'success',
+                'sessions': sessions,
+                'count': len(sessions),
+                'updated_at': sessions_updated_at
+            },
+            'speeds': {
+                'status': 'success',
+                'total_bitrate': total_bitrate,
+                'sessions': speed_sessions,
+                'updated_at': speeds_updated_at
+            },
+            'downloaders': self.get_downloaders_status(),
+            'circuit_breakers': circuit_breakers.get_states()
+        }
+
+    def _apply_server_sessions(self, server_id, server_instance, current_sessions):
+        """根据一次轮询得到的会话列表更新全局会话状态，并在需要时调整下载器速率"""
+        # 计算该服务器的会话ID（只计算不被跳过的会话）
+        server_session_ids = set()
+        current_time = time()
+        skipped_count = 0
+        
+        if current_sessions:
+            # 白名单规则随配置快照预编译，服务器刚从配置中移除时临时构建
+            whitelist = config_manager.get_whitelist_matcher(server_id) or WhitelistMatcher(server_instance)
+            for session in current_sessions:
+                session['source_server'] = server_instance.get('name', server_id)
+                session_id = f"{server_id}:{session['session_id']}"
                 
-                # 计算该服务器的会话ID（只计算不被跳过的会话）
-                server_session_ids = set()
-                current_time = time()
-                skipped_count = 0
+                # 检查是否应该跳过此会话的限速
+                if whitelist.should_skip(session):
+                    skipped_count += 1
+                    # 减少SKIP_LIMIT日志频率：同一用户60秒内只记录一次
+                    user_name = session.get('user_name', 'Unknown')
+                    last_log_time = self.last_skip_log_time.get(user_name, 0)
+                    if current_time - last_log_time > 60:  # 60秒间隔
+                        reason = "本地播放" if session.get('client_ip') and session.get('client_ip') != '' else "白名单用户"
+                        log_manager.log_formatted_event("SKIP_LIMIT", N_("跳过限速 - 用户: {0}, 原因: {1}"), 
+                                                       user_name, reason)
+                        self.last_skip_log_time[user_name] = current_time
+                else:
+                    server_session_ids.add(session_id)
+        
+        # 更新全局活跃会话集合，需要下发的速率在释放锁后下发
+        changes = []
+        with self.lock:
+            # 移除该服务器之前的会话
+            old_server_sessions = {sid for sid in self.active_session_ids if sid.startswith(f"{server_id}:")}
+            self.active_session_ids.difference_update(old_server_sessions)
+            
+            # 添加该服务器的新会话（不包括跳过的）
+            self.active_session_ids.update(server_session_ids)
+            if old_server_sessions != server_session_ids:
+                self._bump_version()
+            
+            # 检查是否需要更新下载器速率和记录日志
+            total_sessions = len(self.active_session_ids)
+            session_changed = old_server_sessions != server_session_ids
+            count_changed = total_sessions != self.last_session_count
+            
+            # 只在会话数量实际变化或30秒无状态更新时记录日志
+            if session_changed and (count_changed or current_time - self.last_status_log_time > 30):
+                if total_sessions > 0:
+                    log_manager.log_formatted_event("PLAY_STATUS", N_("检测到 {0} 个需要限速的播放"), total_sessions)
+                    if skipped_count > 0:
+                        log_manager.log_formatted_event("PLAY_STATUS", N_("已跳过 {0} 个本地/白名单播放"), skipped_count)
+                else:
+                    log_manager.log_event("PLAY_STATUS", N_("所有播放已停止"))
                 
-                if current_sessions:
-                    for session in current_sessions:
-                        session['source_server'] = server_instance.get('name', server_id)
-                        session_id = f"{server_id}:{session['session_id']}"
-                        
-                        # 检查是否应该跳过此会话的限速
-                        if should_skip_speed_limit(session, server_instance):
-                            skipped_count += 1
-                            # 减少SKIP_LIMIT日志频率：同一用户60秒内只记录一次
-                            user_name = session.get('user_name', 'Unknown')
-                            last_log_time = self.last_skip_log_time.get(user_name, 0)
-                            if current_time - last_log_time > 60:  # 60秒间隔
-                                reason = "本地播放" if session.get('client_ip') and session.get('client_ip') != '' else "白名单用户"
-                                log_manager.log_formatted_event("SKIP_LIMIT", _("跳过限速 - 用户: {0}, 原因: {1}"), 
-                                                               user_name, reason)
-                                self.last_skip_log_time[user_name] = current_time
-                        else:
-                            server_session_ids.add(session_id)
+                self.last_session_count = total_sessions
+                self.last_status_log_time = current_time
                 
-                # 更新全局活跃会话集合
-                with self.lock:
-                    # 移除该服务器之前的会话
-                    old_server_sessions = {sid for sid in self.active_session_ids if sid.startswith(f"{server_id}:")}
-                    self.active_session_ids.difference_update(old_server_sessions)
-                    
-                    # 添加该服务器的新会话（不包括跳过的）
-                    self.active_session_ids.update(server_session_ids)
-                    
-                    # 检查是否需要更新下载器速率和记录日志
-                    total_sessions = len(self.active_session_ids)
-                    session_changed = old_server_sessions != server_session_ids
-                    count_changed = total_sessions != self.last_session_count
-                    
-                    # 只在会话数量实际变化或30秒无状态更新时记录日志
-                    if session_changed and (count_changed or current_time - self.last_status_log_time > 30):
-                        if total_sessions > 0:
-                            log_manager.log_formatted_event("PLAY_STATUS", _("检测到 {0} 个需要限速的播放"), total_sessions)
-                            if skipped_count > 0:
-                                log_manager.log_formatted_event("PLAY_STATUS", _("已跳过 {0} 个本地/白名单播放"), skipped_count)
-                        else:
-                            log_manager.log_event("PLAY_STATUS", _("所有播放已停止"))
-                        
-                        self.last_session_count = total_sessions
-                        self.last_status_log_time = current_time
-                        
-                        self._update_speed(settings)
-                    elif session_changed:
-                        # 会话变化但数量未变，仍需更新速率但不记录重复日志
-                        self._update_speed(settings)
-                    
-                    # 定期清理过期的跳过日志时间戳（每10分钟清理一次）
-                    if current_time - self.last_status_log_time > 600:  # 10分钟
-                        expired_users = [user for user, timestamp in self.last_skip_log_time.items() 
-                                       if current_time - timestamp > 3600]  # 1小时过期
-                        for user in expired_users:
-                            del self.last_skip_log_time[user]
+                changes = self._update_speed()
+            elif session_changed:
+                # 会话变化但数量未变，仍需更新速率但不记录重复日志
+                changes = self._update_speed()
             
-            # 重新安排下次检查
-            if self.running:
-                poll_interval = float(server_instance.get('poll_interval', 15))
-                timer = Timer(poll_interval, self._check_server_status, args=[server_id])
-                timer.daemon = True
-                with self.lock:
-                    self.timers[server_id] = timer
-                timer.start()
+            # 定期清理过期的跳过日志时间戳（每10分钟清理一次）
+            if current_time - self.last_status_log_time > 600:  # 10分钟
+                expired_users = [user for user, timestamp in self.last_skip_log_time.items() 
+                               if current_time - timestamp > 3600]  # 1小时过期
+                for user in expired_users:
+                    del self.last_skip_log_time[user]
+        
+        self._apply_limit_changes(changes)
 
     def check_status(self):
         """为了保持向后兼容而保留的方法，现在只是触发重新调度"""
         self._schedule_all_servers()
 
-    def _get_plugin_instance(self, plugin_type_plural, instance_config):
-        """根据实例配置动态加载并实例化插件"""
-        plugin_type_single = instance_config.get("type")
-        if not plugin_type_single:
-            log_manager.log_formatted_event("PLUGIN_ERROR", _("实例配置缺少'type'字段: {0}"), instance_config)
-            return None
-        try:
-            # e.g., 'app.media_servers.emby'
-            module_name = f'app.{plugin_type_plural}.{plugin_type_single}'
-            
-            # 特殊处理一些插件的类名
-            class_name_mapping = {
-                'clouddrive2': 'CloudDrive2',
-                'qbittorrent': 'Qbittorrent',
-                'transmission': 'Transmission'
-            }
-            
-            if plugin_type_single in class_name_mapping:
-                class_name = class_name_mapping[plugin_type_single]
+    def _get_plugin_instance(self, plugin_type_plural, instance_config, pooled=True):
+        """
+        获取插件实例。
+        默认从插件池中取得长期复用的实例；pooled=False 时创建一个独立的新实例（例如测试未保存的配置）。
+        """
+        if pooled:
+            return plugin_pool.get(plugin_type_plural, instance_config)
+        return plugin_pool.create(plugin_type_plural, instance_config)
+
+    def _configure_throttle(self, scheduler_settings):
+        """
+        应用限速迟滞设置。
+        :return: 设置是否有变化
+        """
+        previous = (self.engage_delay, self.release_delay, self.min_hold, self.release_ramp_steps, self.release_ramp_interval)
+        self.engage_delay = max(0.0, float(scheduler_settings.get('engage_delay', 0)))
+        self.release_delay = max(0.0, float(scheduler_settings.get('release_delay', 30)))
+        self.min_hold = max(0.0, float(scheduler_settings.get('min_hold', 60)))
+        self.release_ramp_steps = max(0, int(float(scheduler_settings.get('release_ramp_steps', 0))))
+        self.release_ramp_interval = max(1.0, float(scheduler_settings.get('release_ramp_interval', 10)))
+        return previous != (self.engage_delay, self.release_delay, self.min_hold, self.release_ramp_steps, self.release_ramp_interval)
+
+    def _reset_throttle(self):
+        """清除迟滞状态，回到默认限速模式（调用方需持有 self.lock）"""
+        self.throttled = False
+        self.throttle_changed_at = None
+        self.throttle_pending_since = None
+        self.ramp_step = None
+
+    def _throttle_due(self, wanted):
+        """
+        等待中的切换的到期 monotonic 时间（调用方需持有 self.lock）。
+        min_hold 只推迟恢复默认限速，播放开始时不会因为刚恢复过默认限速而延后限速。
+        """
+        if wanted:
+            return self.throttle_pending_since + self.engage_delay
+        due = self.throttle_pending_since + self.release_delay
+        if self.throttle_changed_at is not None:
+            due = max(due, self.throttle_changed_at + self.min_hold)
+        return due
+
+    def _evaluate_throttle(self, now):
+        """
+        根据当前播放状态推进限速模式（调用方需持有 self.lock）。
+        播放状态与生效模式不一致时，需持续 engage_delay/release_delay 秒才真正切换，
+        恢复默认限速还需距启用播放限速至少 min_hold 秒；状态在此之前恢复则取消切换。
+        :return: 下一次需要重新评估的秒数，没有等待中的切换或逐级恢复时返回 None
+        """
+        wanted = len(self.active_session_ids) > 0
+        wake_in = None
+        if wanted == self.throttled:
+            if self.throttle_pending_since is not None:
+                self.throttle_pending_since = None
+                self._bump_version()
+                log_manager.log_event("PLAY_STATUS", N_("播放状态已恢复，取消限速切换"))
+        else:
+            pending_started = self.throttle_pending_since is None
+            if pending_started:
+                self.throttle_pending_since = now
+                self._bump_version()
+            due = self._throttle_due(wanted)
+            if now >= due:
+                self.throttled = wanted
+                self.throttle_changed_at = now
+                self.throttle_pending_since = None
+                # 恢复默认限速时从播放限速的两倍开始逐级放开
+                self.ramp_step = 1 if not wanted and self.release_ramp_steps > 0 else None
+                self._bump_version()
             else:
-                # e.g., 'Emby'
-                class_name = ''.join(word.capitalize() for word in plugin_type_single.split('_'))
-            
-            module = importlib.import_module(module_name)
-            plugin_class = getattr(module, class_name)
-            
-            return plugin_class(instance_config)
+                if pending_started:
+                    log_manager.log_formatted_event("PLAY_STATUS", N_("播放状态变化，{0} 秒后切换限速"), round(due - now))
+                wake_in = due - now
+
+        if self.ramp_step is not None:
+            ramp_due = self.throttle_changed_at + self.ramp_step * self.release_ramp_interval
+            while self.ramp_step is not None and now >= ramp_due:
+                self.ramp_step += 1
+                ramp_due += self.release_ramp_interval
+                if self.ramp_step > self.release_ramp_steps:
+                    self.ramp_step = None
+                self._bump_version()
+            if self.ramp_step is not None:
+                wake_in = ramp_due - now if wake_in is None else min(wake_in, ramp_due - now)
+        return wake_in
 
-        except (ImportError, AttributeError) as e:
-            log_manager.log_formatted_event("PLUGIN_ERROR", _("加载插件 {0} 失败: {1}"), plugin_type_single, e)
+    def _advance_throttle(self):
+        """推进限速模式，有等待中的切换或逐级恢复时安排迟滞计时任务（调用方需持有 self.lock）"""
+        now = monotonic()
+        wake_in = self._evaluate_throttle(now)
+        if wake_in is not None and self.running:
+            with self.wakeup:
+                self._push_deadline(self.THROTTLE_JOB, now + wake_in)
+
+    def _throttle_tick(self):
+        """迟滞计时到期：重新评估限速模式，按需下发新的限速"""
+        if not self.running or self.app is None:
             return None
+        with self.app.app_context():
+            with self.lock:
+                changes = self._update_speed()
+            self._apply_limit_changes(changes)
+        # 下一次到期时间由 _advance_throttle 安排
+        return None
+
+    def _ramp_limit(self, backup_limit, default_limit):
+        """逐级恢复当前步的速率：播放限速按步数翻倍，达到默认限速（0 为不限速）后取默认值"""
+        if backup_limit <= 0 or (0 < default_limit <= backup_limit):
+            return default_limit
+        limit = backup_limit * 2 ** self.ramp_step
+        if 0 < default_limit <= limit:
+            return default_limit
+        return limit
+
+    def _desired_limits(self, downloader_instance):
+        """根据生效的限速模式计算下载器应使用的速率，需要考虑不同下载器的特性"""
+        downloader_type = downloader_instance.get('type', '')
+        
+        # 使用播放时的速率，需要为SABnzbd设置不同的默认值
+        if downloader_type == 'sabnzbd':
+            backup_dl_limit = downloader_instance.get('backup_download_limit', 50)  # SABnzbd默认50%
+            backup_ul_limit = 0  # SABnzbd不支持上传
+        else:
+            backup_dl_limit = downloader_instance.get('backup_download_limit', 1024)
+            backup_ul_limit = downloader_instance.get('backup_upload_limit', 512)
+        if self.throttled:
+            return backup_dl_limit, backup_ul_limit
+        
+        # 使用默认速率，需要为SABnzbd设置不同的默认值
+        if downloader_type == 'sabnzbd':
+            dl_limit = downloader_instance.get('default_download_limit', 100)  # SABnzbd默认100%
+            ul_limit = 0  # SABnzbd不支持上传
+        else:
+            dl_limit = downloader_instance.get('default_download_limit', 0)
+            ul_limit = downloader_instance.get('default_upload_limit', 0)
+        
+        if self.ramp_step is not None:
+            return self._ramp_limit(backup_dl_limit, dl_limit), self._ramp_limit(backup_ul_limit, ul_limit)
+        return dl_limit, ul_limit
+
+    def _update_speed(self):
+        """
+        根据播放状态推进限速模式，收集速率需要变化的已启用下载器（调用方需持有 self.lock）。
+        返回的下发计划由调用方在释放 self.lock 后交给 _apply_limit_changes，下发期间不阻塞快照读取。
+        """
+        self._advance_throttle()
+        
+        # 收集速率有变化的下载器，避免重复设置
+        changes = []
+        for downloader_instance in config_manager.get_enabled_downloaders():
+            downloader_id = downloader_instance.get('id')
+            current_speed = self._desired_limits(downloader_instance)
+            if downloader_id in self.applying:
+                # 已有下发在进行：相同的速率不再重复下发，不同的速率取代它
+                if self.applying[downloader_id] != current_speed:
+                    changes.append((downloader_instance, current_speed))
+            elif self.last_speed_state.get(downloader_id) != current_speed:
+                changes.append((downloader_instance, current_speed))
+        
+        return self._reserve_applies(changes)
+
+    def _reserve_applies(self, changes):
+        """
+        为每个下发分配调用序号，同一下载器更早的未完成下发随之作废（调用方需持有 self.lock）。
+        :param changes: [(downloader_instance, (dl_limit, ul_limit))]
+        :return: [(downloader_instance, (dl_limit, ul_limit), sequence)]
+        """
+        plan = []
+        for downloader_instance, current_speed in changes:
+            downloader_id = downloader_instance.get('id')
+            sequence = next(self.apply_sequence)
+            self.latest_apply[downloader_id] = sequence
+            self.applying[downloader_id] = current_speed
+            plan.append((downloader_instance, current_speed, sequence))
+        return plan
 
-    def _update_speed(self, settings):
-        """根据播放状态更新所有已启用下载器的速率"""
-        # 遍历所有已启用的下载器实例并应用各自的速率设置
-        for downloader_instance in settings.get('downloaders', []):
-            if downloader_instance.get('enabled'):
+    def _apply_limit_changes(self, plan):
+        """
+        下发一组限速并记录结果（调用方不能持有 self.lock）。
+        网络调用期间不持有 self.lock，完成后重新获取锁记录结果；
+        只记录每个下载器最新一次下发的结果，已被取代的下发由取代它的下发记录。
+        下发失败的期望限速记入 pending_limits，由对账在下载器恢复后重新下发。
+        :param plan: _update_speed 或 _reserve_applies 返回的下发计划
+        """
+        if not plan:
+            return
+        
+        # 并发下发到所有下载器，总耗时取决于最慢的主机而不是所有主机之和
+        started = monotonic()
+        results = self._apply_speed_limits(plan)
+        
+        with self.lock:
+            self.last_apply_duration = monotonic() - started
+            # 实际限速和待重试的限速都在仪表盘数据中，变化时需要更新状态版本
+            previous_limits = (dict(self.actual_limits), dict(self.pending_limits))
+            for downloader_instance, current_speed, sequence in plan:
                 downloader_id = downloader_instance.get('id')
-                downloader_name = downloader_instance.get('name', downloader_id)
-                
-                # 根据是否有播放活动确定要使用的速率，需要考虑不同下载器的特性
-                downloader_type = downloader_instance.get('type', '')
+                if self.latest_apply.get(downloader_id) != sequence:
+                    continue
+                self.applying.pop(downloader_id, None)
+                result = results.get(downloader_id)
+                if result is None:
+                    continue
+                self.last_apply_results[downloader_id] = result
                 
-                if len(self.active_session_ids) > 0:
-                    # 使用播放时的速率，需要为SABnzbd设置不同的默认值
-                    if downloader_type == 'sabnzbd':
-                        dl_limit = downloader_instance.get('backup_download_limit', 50)  # SABnzbd默认50%
-                        ul_limit = 0  # SABnzbd不支持上传
-                    else:
-                        dl_limit = downloader_instance.get('backup_download_limit', 1024)
-                        ul_limit = downloader_instance.get('backup_upload_limit', 512)
-                else:
-                    # 使用默认速率，需要为SABnzbd设置不同的默认值
-                    if downloader_type == 'sabnzbd':
-                        dl_limit = downloader_instance.get('default_download_limit', 100)  # SABnzbd默认100%
-                        ul_limit = 0  # SABnzbd不支持上传
+                downloader_name = downloader_instance.get('name', downloader_id)
+                dl_limit, ul_limit = current_speed
+                if result['success']:
+                    # 记录成功日志，使用实例名称，区分SABnzbd的百分比显示
+                    if downloader_instance.get('type', '') == 'sabnzbd':
+                        log_manager.log_formatted_event("SPEED_CHANGE", N_("{0} 速率限制设置成功: 下载 {1}%, 上传不支持"), downloader_name, dl_limit)
                     else:
-                        dl_limit = downloader_instance.get('default_download_limit', 0)
-                        ul_limit = downloader_instance.get('default_upload_limit', 0)
+                        log_manager.log_formatted_event("SPEED_CHANGE", N_("{0} 速率限制设置成功: 下载 {1} KB/s, 上传 {2} KB/s"), downloader_name, dl_limit, ul_limit)
+                    # 只有成功设置后才更新状态记录
+                    self.last_speed_state[downloader_id] = current_speed
+                    self.actual_limits[downloader_id] = current_speed
+                    self.pending_limits.pop(downloader_id, None)
+                    continue
                 
-                # 检查速率是否有变化，避免重复设置
-                current_speed = (dl_limit, ul_limit)
-                last_speed = self.last_speed_state.get(downloader_id)
-                
-                if last_speed != current_speed:
-                    downloader = self._get_plugin_instance('downloaders', downloader_instance)
-                    if downloader:
-                        success = downloader.set_speed_limits(dl_limit, ul_limit)
-                        if success:
-                            # 记录成功日志，使用实例名称，区分SABnzbd的百分比显示
-                            if downloader_type == 'sabnzbd':
-                                log_manager.log_formatted_event("SPEED_CHANGE", _("{0} 速率限制设置成功: 下载 {1}%, 上传不支持"), downloader_name, dl_limit)
-                            else:
-                                log_manager.log_formatted_event("SPEED_CHANGE", _("{0} 速率限制设置成功: 下载 {1} KB/s, 上传 {2} KB/s"), downloader_name, dl_limit, ul_limit)
-                            # 只有成功设置后才更新状态记录
-                            self.last_speed_state[downloader_id] = current_speed
-                        else:
-                            log_manager.log_formatted_event("SPEED_ERROR", _("{0} 速率设置失败"), downloader_name)
-                # else:
-                #     # 速率未变化，跳过设置（可选：记录调试日志）
-                #     log_manager.log_event("SPEED_DEBUG", f"{downloader_name} 速率未变化，跳过设置")
+                self.pending_limits[downloader_id] = current_speed
+                if result['error'] == 'timeout':
+                    log_manager.log_formatted_event("SPEED_ERROR", N_("{0} 速率设置超时（{1} 秒）"), downloader_name, self.call_timeout)
+                else:
+                    log_manager.log_formatted_event("SPEED_ERROR", N_("{0} 速率设置失败"), downloader_name)
+            if (self.actual_limits, self.pending_limits) != previous_limits:
+                self._bump_version()
+
+    def _apply_speed_limits(self, plan):
+        """
+        并发调用各下载器的 set_speed_limits，每个调用都受 call_timeout 截止时间约束。
+        :param plan: [(downloader_instance, (dl_limit, ul_limit), sequence)]
+        :return: {downloader_id: {'success': bool, 'latency': float, 'error': str 或 None, 'at': float}}
+        """
+        calls = {}
+        for downloader_instance, (dl_limit, ul_limit), sequence in plan:
+            downloader = self._get_plugin_instance('downloaders', downloader_instance)
+            if downloader:
+                calls[downloader_instance.get('id')] = (sequence, downloader, dl_limit, ul_limit)
+        return self._apply_speed_limits_threaded(calls)
+
+    def _get_apply_executor(self):
+        """获取下载器调用使用的线程池（首次使用时创建）"""
+        with self.lock:
+            if self.apply_executor is None:
+                self.apply_executor = ThreadPoolExecutor(max_workers=self.max_apply_workers, thread_name_prefix='auto-limit-apply')
+            return self.apply_executor
+
+    def _apply_speed_limits_threaded(self, calls):
+        """
+        在限速线程池中并发下发速率（调用方不持有 self.lock）。
+        超时的调用会在后台继续执行：同一下载器的调用按实例串行，
+        开始执行前已有更新请求的调用直接放弃，避免迟到的旧限速覆盖新限速。
+        :param calls: {downloader_id: (sequence, downloader, dl_limit, ul_limit)}
+        """
+        executor = self._get_apply_executor()
+        
+        def timed_call(downloader_id, sequence, downloader, dl_limit, ul_limit):
+            call_started = monotonic()
+            with self.apply_locks[downloader_id]:
+                if self.latest_apply.get(downloader_id) != sequence:
+                    return False, monotonic() - call_started, 'superseded'
+                try:
+                    with log_manager.source(downloader_id):
+                        return bool(downloader.set_speed_limits(dl_limit, ul_limit)), monotonic() - call_started, None
+                except Exception as e:
+                    return False, monotonic() - call_started, str(e)
+        
+        started = monotonic()
+        futures = {}
+        for downloader_id, call in calls.items():
+            self.apply_locks.setdefault(downloader_id, Lock())
+            futures[executor.submit(timed_call, downloader_id, *call)] = downloader_id
+        done, _not_done = wait(futures, timeout=self.call_timeout)
+        
+        results = {}
+        for future, downloader_id in futures.items():
+            if future in done:
+                success, latency, error = future.result()
+            else:
+                # 超时的调用在后台继续执行，但本轮视为失败，记入待重试的限速
+                success, latency, error = False, monotonic() - started, 'timeout'
+            results[downloader_id] = {'success': success, 'latency': latency, 'error': error, 'at': time()}
+        return results
+
+    def get_apply_results(self):
+        """获取最近一次下发速率的每实例结果和整体耗时（秒）"""
+        with self.lock:
+            return {
+                'duration': self.last_apply_duration,
+                'downloaders': {downloader_id: dict(result) for downloader_id, result in self.last_apply_results.items()}
+            }
 
 scheduler = Scheduler() 
\ No newline at end of file
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+from threading import Lock
+
+class TokenStore:
+    """
+    插件登录令牌的缓存。
+    令牌保存在内存中，并原子地持久化到数据目录下独立的 tokens.json，
+    令牌刷新或过期不会重写 config.json，也不会与界面保存配置相互竞争。
+    每个令牌记录签发时的地址和用户名，凭据变化后旧令牌自动失效。
+    """
+    FILE_NAME = 'tokens.json'
+
+    def __init__(self):
+        self.path = None
+        self.tokens = {}  # {实例ID: {'token': str, 'url': str, 'username': str}}
+        self.lock = Lock()
+
+    def init_app(self, app):
+        self.path = os.path.join(app.config['DATA_DIR'], self.FILE_NAME)
+        self._load()
+
+    def _load(self):
+        """从文件加载令牌，文件不存在或损坏时从空缓存开始"""
+        tokens = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                tokens = {key: value for key, value in data.items() if isinstance(value, dict) and value.get('token')}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"读取令牌文件失败，将重新登录: {e}")
+        with self.lock:
+            self.tokens = tokens
+
+    def _write_file(self, tokens):
+        """通过临时文件和rename原子地写入令牌文件，仅所有者可读写"""
+        if self.path is None:
+            return
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                mode='w',
+                encoding='utf-8',
+                dir=os.path.dirname(self.path),
+                prefix='tokens_',
+                suffix='.tmp',
+                delete=False
+            ) as temp_file:
+                temp_path = temp_file.name
+                os.chmod(temp_path, 0o600)
+                json.dump(tokens, temp_file, ensure_ascii=False)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, self.path)
+        except OSError:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def get(self, instance_id, url=None, username=None):
+        """获取实例的令牌，地址或用户名与签发时不同则视为无效"""
+        entry = self.tokens.get(instance_id)
+        if not entry:
+            return None
+        if entry.get('url') != url or entry.get('username') != username:
+            return None
+        return entry['token']
+
+    def set(self, instance_id, token, url=None, username=None):
+        """保存令牌，token 为空时清除；内容未变化时不写文件"""
+        if not instance_id:
+            return
+        if not token:
+            self.discard(instance_id)
+            return
+        entry = {'token': token, 'url': url, 'username': username}
+        with self.lock:
+            if self.tokens.get(instance_id) == entry:
+                return
+            tokens = dict(self.tokens)
+            tokens[instance_id] = entry
+            self._write_file(tokens)
+            self.tokens = tokens
+
+    def discard(self, instance_id):
+        """清除实例的令牌"""
+        with self.lock:
+            if instance_id not in self.tokens:
+                return
+            tokens = dict(self.tokens)
+            del tokens[instance_id]
+            self._write_file(tokens)
+            self.tokens = tokens
+
+    def migrate_from_config(self, config_manager):
+        """把旧版本写在 config.json 实例配置里的 saved_token 迁移到令牌文件"""
+        for instance in config_manager.get_settings().get('downloaders', ()):
+            token = instance.get('saved_token')
+            instance_id = instance.get('id')
+            if not token or not instance_id:
+                continue
+            if instance_id not in self.tokens:
+                self.set(instance_id, token, instance.get('url', '').rstrip('/'), instance.get('username'))
+            config_manager.update_instance('downloaders', instance_id, lambda d: d.pop('saved_token', None))
+
+token_store = TokenStore()
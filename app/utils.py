@@ -1,3 +1,4 @@
+import bisect
 import ipaddress
 import re
 from typing import List, Union
@@ -88,8 +89,11 @@ def is_user_in_whitelist(username: str, whitelist: List[str]) -> bool:
 def parse_whitelist_text(text: str) -> List[str]:
     """
     解析白名单文本，支持多种分隔符
+    手工编辑的配置中写成列表的白名单按每项一行处理，其他非字符串值视为空
     """
-    if not text:
+    if isinstance(text, (list, tuple)):
+        text = '\n'.join(str(item) for item in text)
+    if not text or not isinstance(text, str):
         return []
     
     # 支持换行、逗号、分号分隔
@@ -106,30 +110,103 @@ def parse_whitelist_text(text: str) -> List[str]:
     return items
 
 
+class WhitelistMatcher:
+    """
+    预编译的跳过限速规则，由配置快照为每个媒体服务器的每个配置版本构建一次。
+    IP白名单按地址族合并为有序的整数区间，用二分查找匹配；
+    用户白名单分为精确匹配的集合和合并后的通配符正则；
+    同一客户端IP的判定结果会被缓存，会话检查基本是常数时间。
+    """
+    MAX_MEMO_SIZE = 4096
+
+    def __init__(self, server_config: dict):
+        self.enabled = bool(server_config.get('skip_local_playback', False))
+        self.ip_items = parse_whitelist_text(server_config.get('ip_whitelist', ''))
+        self.ranges = {4: ([], []), 6: ([], [])}  # {地址族: (区间起点列表, 区间终点列表)}
+        self.substrings = []  # 无法解析为IP或网段的条目，按子串匹配
+        self._compile_ip_whitelist()
+
+        self.users = set()
+        wildcard_patterns = []
+        for user in parse_whitelist_text(server_config.get('user_whitelist', '')):
+            user = user.strip().lower()
+            if '*' in user:
+                wildcard_patterns.append(re.escape(user).replace(r'\*', '.*'))
+            elif user:
+                self.users.add(user)
+        self.user_pattern = re.compile('|'.join(wildcard_patterns)) if wildcard_patterns else None
+
+        self.ip_verdicts = {}  # {client_ip: 是否因IP跳过限速}
+
+    def _compile_ip_whitelist(self):
+        intervals = {4: [], 6: []}
+        for item in self.ip_items:
+            try:
+                if '/' in item:
+                    network = ipaddress.ip_network(item, strict=False)
+                    first, last = network.network_address, network.broadcast_address
+                else:
+                    first = last = ipaddress.ip_address(item)
+            except ValueError:
+                # 可能是域名或其他格式
+                self.substrings.append(item)
+                continue
+            intervals[first.version].append((int(first), int(last)))
+
+        for version, items in intervals.items():
+            starts, ends = self.ranges[version]
+            # 合并重叠或相邻的区间，保证每个地址最多落在一个区间内
+            for first, last in sorted(items):
+                if ends and first <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], last)
+                else:
+                    starts.append(first)
+                    ends.append(last)
+
+    def _ip_in_ranges(self, ip) -> bool:
+        starts, ends = self.ranges[ip.version]
+        value = int(ip)
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+    def ip_allowed(self, ip_str: str) -> bool:
+        """客户端IP是否在白名单中或属于内网地址"""
+        verdict = self.ip_verdicts.get(ip_str)
+        if verdict is None:
+            verdict = self._evaluate_ip(ip_str)
+            if len(self.ip_verdicts) >= self.MAX_MEMO_SIZE:
+                self.ip_verdicts.clear()
+            self.ip_verdicts[ip_str] = verdict
+        return verdict
+
+    def _evaluate_ip(self, ip_str: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(ip_str)
+        except ValueError:
+            # 输入的IP地址无效，只能按字符串匹配
+            return any(item in ip_str for item in self.ip_items)
+        if self._ip_in_ranges(ip) or any(item in ip_str for item in self.substrings):
+            return True
+        return ip.is_private or ip.is_loopback or ip.is_link_local
+
+    def user_allowed(self, username: str) -> bool:
+        """用户名是否在白名单中（不区分大小写，支持通配符）"""
+        if not username:
+            return False
+        username = username.strip().lower()
+        if username in self.users:
+            return True
+        return self.user_pattern is not None and self.user_pattern.fullmatch(username) is not None
+
+    def should_skip(self, session_info: dict) -> bool:
+        if not self.enabled:
+            return False
+        return self.ip_allowed(session_info.get('client_ip', '')) or self.user_allowed(session_info.get('user_name', ''))
+
+
 def should_skip_speed_limit(session_info: dict, server_config: dict) -> bool:
     """
     判断是否应该跳过限速
-    根据服务器配置和会话信息决定
+    根据服务器配置和会话信息决定：IP白名单、用户白名单或内网IP
     """
-    # 如果没有启用本地播放跳过功能，不跳过
-    if not server_config.get('skip_local_playback', False):
-        return False
-    
-    client_ip = session_info.get('client_ip', '')
-    username = session_info.get('user_name', '')
-    
-    # 检查IP白名单
-    ip_whitelist = parse_whitelist_text(server_config.get('ip_whitelist', ''))
-    if is_ip_in_whitelist(client_ip, ip_whitelist):
-        return True
-    
-    # 检查用户白名单
-    user_whitelist = parse_whitelist_text(server_config.get('user_whitelist', ''))
-    if is_user_in_whitelist(username, user_whitelist):
-        return True
-    
-    # 检查是否为内网IP（如果启用了跳过本地播放）
-    if is_private_ip(client_ip):
-        return True
-    
-    return False 
\ No newline at end of file
+    return WhitelistMatcher(server_config).should_skip(session_info)
@@ -30,7 +30,7 @@ def run_command(cmd, description):
 
 def extract_messages():
     """提取需要翻译的消息"""
-    cmd = "pybabel extract -F babel.cfg -k _ -o messages.pot ."
+    cmd = "pybabel extract -F babel.cfg -k _ -k _l -k N_ -o messages.pot ."
     run_command(cmd, "提取翻译字符串")
 
 def update_translations():
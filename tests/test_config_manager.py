@@ -0,0 +1,27 @@
+import json
+
+from flask import Flask
+
+from app.services.config_manager import ConfigManager
+
+
+def test_load_settings_accepts_list_whitelists(tmp_path):
+    settings = {
+        'media_servers': [{
+            'id': 'emby-1',
+            'type': 'emby',
+            'enabled': False,
+            'skip_local_playback': True,
+            'ip_whitelist': ['10.0.0.0/8', '192.168.1.1'],
+            'user_whitelist': 5
+        }]
+    }
+    (tmp_path / 'config.json').write_text(json.dumps(settings), encoding='utf-8')
+    app = Flask(__name__)
+    app.config['DATA_DIR'] = str(tmp_path)
+    manager = ConfigManager()
+    manager.init_app(app)
+
+    matcher = manager.get_whitelist_matcher('emby-1')
+    assert matcher.ip_items == ['10.0.0.0/8', '192.168.1.1']
+    assert not matcher.users
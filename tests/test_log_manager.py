@@ -0,0 +1,57 @@
+import json
+
+from flask import Flask
+
+from app.services.config_manager import config_manager
+from app.services.log_manager import LogManager, N_
+
+
+def create_log_manager(data_dir):
+    app = Flask(__name__)
+    app.config['DATA_DIR'] = str(data_dir)
+    config_manager.init_app(app)
+    manager = LogManager()
+    manager.init_app(app)
+    return manager
+
+
+def test_repeated_event_after_migrating_legacy_logs(tmp_path):
+    legacy_logs = [{'timestamp': '2024-01-01 00:00:00.000', 'type': 'SYSTEM', 'message': 'old'}]
+    (tmp_path / 'logs.json').write_text(json.dumps(legacy_logs), encoding='utf-8')
+    manager = create_log_manager(tmp_path)
+
+    manager.log_formatted_event('X', N_('hello {0}'), 1)
+    manager.log_formatted_event('X', N_('hello {0}'), 1)
+
+    logs = manager.get_logs()
+    assert [log.get('message') for log in logs] == ['hello 1', 'old']
+    assert logs[0]['count'] == 2
+
+
+def test_interleaved_repeats_coalesce_per_event(tmp_path):
+    manager = create_log_manager(tmp_path)
+
+    for _ in range(30):
+        manager.log_formatted_event('QB_ERROR', 'qBittorrent连接错误: {0}', 'host-a refused')
+        manager.log_formatted_event('QB_ERROR', 'qBittorrent连接错误: {0}', 'host-b refused')
+
+    logs = manager.get_logs()
+    assert [(log['message'], log['count']) for log in logs] == [
+        ('qBittorrent连接错误: host-b refused', 30),
+        ('qBittorrent连接错误: host-a refused', 30),
+    ]
+
+
+def test_rate_limit_is_per_source(tmp_path):
+    manager = create_log_manager(tmp_path)
+    manager.configure({'rate_limit_burst': 3, 'rate_limit_per_minute': 1})
+
+    with manager.source('qb-a'):
+        for index in range(10):
+            manager.log_formatted_event('QB_ERROR', '设置速率限制时出错: {0}', f'host-a error {index}')
+    with manager.source('qb-b'):
+        manager.log_formatted_event('QB_ERROR', '设置速率限制时出错: {0}', 'host-b error')
+
+    messages = [log['message'] for log in manager.get_logs()]
+    assert len([message for message in messages if 'host-a' in message]) == 3
+    assert '设置速率限制时出错: host-b error' in messages
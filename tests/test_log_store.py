@@ -0,0 +1,19 @@
+import json
+
+from app.services.log_store import SegmentedLogStore
+
+
+def test_read_returns_migrated_logs_newest_first(tmp_path):
+    legacy_logs = [
+        {'timestamp': '2024-01-03 00:00:00.000', 'type': 'SYSTEM', 'message': 'newest'},
+        {'timestamp': '2024-01-02 00:00:00.000', 'type': 'SYSTEM', 'message': 'mid'},
+        {'timestamp': '2024-01-01 00:00:00.000', 'type': 'SYSTEM', 'message': 'oldest'},
+    ]
+    legacy_path = tmp_path / 'logs.json'
+    legacy_path.write_text(json.dumps(legacy_logs), encoding='utf-8')
+    store = SegmentedLogStore(str(tmp_path / 'logs'))
+    store.migrate_from_json(str(legacy_path))
+    store.append([{'id': 1, 'timestamp': '2024-01-04 00:00:00.000', 'type': 'SYSTEM', 'template': 'new'}])
+
+    assert [entry.get('message', entry.get('template')) for entry in store.read()] == ['new', 'newest', 'mid', 'oldest']
+    assert [entry.get('message', entry.get('template')) for entry in store.read(2)] == ['new', 'newest']